@@ -1,5 +1,6 @@
 """ Define alexnet model. """
-from keras.layers import Conv2D, MaxPooling2D, Input, Flatten, Dense
+from keras import backend as K
+from keras.layers import Conv2D, MaxPooling2D, Input, Flatten, Dense, Activation, Lambda
 from keras.models import Model
 
 
@@ -41,16 +42,117 @@ def block1():
     return Model(image, layer)
 
 
-def fc1():
-    """ First separated fully connected layer. """
+def neurons(units, part, parts):
+    """ First and last (exclusive) output neuron of slice part of a layer split into parts. """
+    return units * part // parts, units * (part + 1) // parts
+
+
+def fc1(part=0, parts=2):
+    """
+        First separated fully connected layer. It is split by output neurons,
+        this is slice part of parts, half of the layer by default.
+    """
     block_input = Input(shape=(6272,))
-    layer = Dense(2048, activation='relu')(block_input)
+    first, last = neurons(4096, part, parts)
+    layer = Dense(last - first, activation='relu')(block_input)
     return Model(block_input, layer)
 
 
-def fc2():
-    """ Second fully connected layer. """
+def fc2(part=None, parts=1):
+    """
+        Second fully connected layer. Without part it is the whole block.
+        Slice part of parts has output neurons of its slice of the first layer
+        and rows of the same slice of the second, so its output is a partial
+        sum of the logits, with the bias on slice 0. The sum of all slices goes
+        through softmax.
+    """
     block_input = Input(shape=(4096,))
-    layer = Dense(4096, activation='relu')(block_input)
-    layer = Dense(1000, activation='softmax')(layer)
-    return Model(block_input, layer)
\ No newline at end of file
+    if part is None:
+        layer = Dense(4096, activation='relu')(block_input)
+        layer = Dense(1000, activation='softmax')(layer)
+    else:
+        first, last = neurons(4096, part, parts)
+        layer = Dense(last - first, activation='relu')(block_input)
+        layer = Dense(1000, use_bias=part == 0)(layer)
+    return Model(block_input, layer)
+
+
+def softmax():
+    """ Softmax of the logits summed from slices of fc2. """
+    block_input = Input(shape=(1000,))
+    layer = Activation('softmax')(block_input)
+    return Model(block_input, layer)
+
+
+def slices(weights, part, parts):
+    """
+        Weights of slice part of a split fully connected block, from weights of
+        the whole block as get_weights returns them. The first layer keeps the
+        columns of its output neurons, a second layer the same rows of its
+        kernel, and its bias on slice 0 only.
+    """
+    kernel, bias = weights[:2]
+    first, last = neurons(len(bias), part, parts)
+    result = [kernel[:, first:last], bias[first:last]]
+    if len(weights) > 2:
+        result.append(weights[2][first:last])
+        if part == 0:
+            result.append(weights[3])
+    return result
+
+
+def layers():
+    """
+        Layers of the whole alexnet in order, both halves of fc1 are one layer.
+        A partition planned by planner.py runs a slice of them.
+    """
+    return [Conv2D(48, kernel_size=(11, 11), activation='relu', strides=(4, 4), padding='same'),
+            MaxPooling2D(strides=(2, 2), pool_size=(2, 2)),
+            Conv2D(128, kernel_size=(5, 5), activation='relu', padding='same'),
+            MaxPooling2D(strides=(2, 2), pool_size=(2, 2)),
+            Conv2D(192, kernel_size=(3, 3), activation='relu', padding='same'),
+            Conv2D(192, kernel_size=(3, 3), activation='relu', padding='same'),
+            Conv2D(128, kernel_size=(3, 3), activation='relu', padding='same'),
+            MaxPooling2D(strides=(2, 2), pool_size=(2, 2)),
+            Flatten(),
+            Dense(4096, activation='relu'),
+            Dense(4096, activation='relu'),
+            Dense(1000, activation='softmax')]
+
+
+def shapes():
+    """ Input shape of each layer in layers, followed by output shape of the last one. """
+    result = [(None, 224, 224, 3)]
+    for layer in layers():
+        result.append(layer.compute_output_shape(result[-1]))
+    return [shape[1:] for shape in result]
+
+
+def part(first, last):
+    """ Layers first to last (exclusive) of the whole alexnet. """
+    block_input = Input(shape=shapes()[first])
+    layer = block_input
+    for block in layers()[first:last]:
+        layer = block(layer)
+    return Model(block_input, layer)
+
+
+def precision(builder, dtype):
+    """
+        Model of builder computed in a reduced precision dtype, such as float16.
+        Its layers are built with dtype as Keras float type, so weights and
+        activations are dtype. Input and output stay float32 and are cast at
+        the edges of the block, so previous and next stage do not change.
+    """
+    floatx = K.floatx()
+    K.set_floatx(dtype)
+    try:
+        model = builder()
+    finally:
+        K.set_floatx(floatx)
+    block_input = Input(shape=model.input_shape[1:])
+    layer = Lambda(K.cast, arguments={'dtype': dtype})(block_input)
+    for block in model.layers[1:]:
+        layer = block(layer)
+    layer = Lambda(K.cast, arguments={'dtype': floatx})(layer)
+    return Model(block_input, layer)
@@ -0,0 +1,6 @@
+"""
+    Node, data sender and tools shared by every deployment. A deployment
+    directory holds only its model.py and resource/ with the topology file and
+    IP table. Scripts here are run from the deployment directory, which they
+    read model.py and resource/ from.
+"""
@@ -0,0 +1,125 @@
+"""
+    This module estimates clock offset and round trip time of peer devices
+    with NTP like ping exchanges, so timestamps taken on different devices can
+    be compared without NTP on the device network.
+
+    A ping sends local time t0, the peer answers with its time T, and the
+    answer arrives at local time t3. Assuming the network delay is the same
+    both ways, the offset of the peer clock is T - (t0 + t3) / 2 with an error
+    of at most half the round trip time t3 - t0. The sample with the lowest
+    round trip time of recent ones is the most accurate, so it is used.
+
+    Peers are the devices a node sends to, they are pinged once they are
+    known, quickly at first until enough samples are taken.
+"""
+import time
+from collections import deque
+from threading import Thread, Lock
+
+from pool import CONNECTION_ERRORS
+
+
+class ClockTable(object):
+    """
+        Clock offset and round trip time of each peer.
+
+        Attributes:
+            size: Number of recent samples kept for each peer.
+            samples: A dictionary maps (address, port) of peer to deque of (round
+                    trip time, offset) samples.
+            down: Peers the last ping to which failed.
+            lock: Threading lock for samples.
+    """
+
+    def __init__(self, size=8):
+        self.size = size
+        self.samples = dict()
+        self.down = set()
+        self.lock = Lock()
+
+    def watch(self, peer):
+        """ Start pinging a peer. """
+        if peer not in self.samples:
+            with self.lock:
+                self.samples.setdefault(peer, deque(maxlen=self.size))
+
+    def peers(self):
+        with self.lock:
+            return sorted(self.samples)
+
+    def settled(self):
+        """ Check if every peer that is up has enough samples. """
+        with self.lock:
+            return all(len(samples) == self.size or peer in self.down
+                       for peer, samples in self.samples.items())
+
+    def add(self, peer, sent, remote, received):
+        """
+            Record one ping exchange.
+
+            Args:
+                peer: Tuple of address and port of peer.
+                sent: Local time the ping is sent.
+                remote: Peer time in the answer.
+                received: Local time the answer arrives.
+        """
+        with self.lock:
+            self.samples.setdefault(peer, deque(maxlen=self.size)).append(
+                (received - sent, remote - (sent + received) / 2))
+            self.down.discard(peer)
+
+    def best(self, peer):
+        """ Sample with the lowest round trip time, None if peer is never pinged. """
+        with self.lock:
+            samples = self.samples.get(peer)
+            return min(samples) if samples else None
+
+    def offset(self, peer):
+        """ Peer clock minus local clock in seconds, 0 if unknown. """
+        sample = self.best(peer)
+        return sample[1] if sample is not None else 0.0
+
+    def report(self):
+        lines = []
+        for address, port in self.peers():
+            sample = self.best((address, port))
+            if sample is not None:
+                lines.append('{:s}:{:d} offset: {:+.2f} ms, rtt: {:.2f} ms'.format(
+                    address, port, 1000 * sample[1], 1000 * sample[0]))
+        return ', '.join(lines)
+
+
+def ping(pool, table, interval, verbose=True, burst=0.1):
+    """
+        Ping peers forever and print clock table after each round if verbose.
+        A peer that is not up yet is tried again next round.
+
+        Args:
+            pool: Connection pool to peers.
+            table: Clock table with peers to ping.
+            interval: Seconds between rounds.
+            verbose: Flag for printing clock table after each round.
+            burst: Seconds between rounds while some peer has too few samples.
+    """
+    while True:
+        settled = table.settled()
+        for address, port in table.peers():
+            sent = time.time()
+            try:
+                remote = pool.ping(address, port)
+            except CONNECTION_ERRORS:
+                with table.lock:
+                    table.down.add((address, port))
+                continue
+            table.add((address, port), sent, remote, time.time())
+        if verbose and settled and table.samples:
+            print 'clock: {:s}'.format(table.report())
+        time.sleep(interval if settled else burst)
+
+
+def start(pool, table, interval, verbose=True):
+    """ Run ping exchanges in a daemon thread. """
+    thread = Thread(target=ping, args=(pool, table, interval, verbose))
+    thread.daemon = True
+    thread.start()
+    return thread
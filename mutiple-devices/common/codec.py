@@ -0,0 +1,209 @@
+"""
+    This module defines codecs for activations sent between devices. A codec
+    packet is self-describing, it starts with codec name and original dtype
+    followed by the codec body, so the receiver decodes any packet without
+    knowing which codec the sender picked for that edge.
+
+    Codecs:
+        raw: Tensor as it is.
+        float16: Tensor cast to float16, cast back to original dtype by receiver.
+        int8: Per-tensor affine quantization to 8 bits with scale and minimum.
+        zlib: Lossless zlib compression of raw tensor.
+        sparse: Bitmap of nonzero elements followed by packed nonzero values, for
+                activations after ReLU.
+        auto: sparse when measured sparsity passes threshold, otherwise raw.
+
+    A shm packet is not a codec of its own, it points to an encoded packet in
+    shared memory ring buffer of a sender on the same host.
+"""
+import struct
+import zlib
+from threading import Lock
+
+import numpy as np
+
+import shm
+import wire
+
+CODEC = struct.Struct('!8s8s')
+AFFINE = struct.Struct('!ff')
+SHM = struct.Struct('!QI')
+CODECS = ('raw', 'float16', 'int8', 'zlib', 'sparse', 'auto')
+# a float32 bitmap packet is smaller than raw above 1/32 sparsity, the
+# threshold leaves room for the cost of packing.
+THRESHOLD = 0.3
+
+
+def sparsity(X):
+    """ Fraction of zero elements. """
+    return 1.0 - np.count_nonzero(X) / float(X.size) if X.size > 0 else 0.0
+
+
+def choose(name, zeros, threshold=THRESHOLD):
+    """
+        Resolve auto codec by measured sparsity.
+
+        Args:
+            name: Codec name.
+            zeros: Measured sparsity of tensor.
+            threshold: Sparsity from which sparse codec is used.
+
+        Returns:
+            Codec name that is not auto.
+    """
+    if name == 'auto':
+        return 'sparse' if zeros >= threshold else 'raw'
+    return name
+
+
+def encode(X, name='raw'):
+    """
+        Encode array with codec. The body is kept as a numpy array when possible
+        so raw TCP transport can send it straight from array buffer.
+
+        Args:
+            X: numpy array.
+            name: Codec name.
+
+        Returns:
+            Tuple of header byte string and body, the body is numpy array or
+            byte string.
+
+        Raises:
+            ValueError: if codec is unknown.
+    """
+    X = np.ascontiguousarray(X)
+    name = choose(name, sparsity(X)) if name == 'auto' else name
+    head = CODEC.pack(name, X.dtype.str)
+    if name == 'raw':
+        return head + wire.header(X), X
+    elif name == 'float16':
+        Y = X.astype(np.float16)
+        return head + wire.header(Y), Y
+    elif name == 'int8':
+        low = float(X.min()) if X.size > 0 else 0.0
+        high = float(X.max()) if X.size > 0 else 0.0
+        scale = (high - low) / 255 if high > low else 1.0
+        Y = np.rint((X.astype(np.float32) - low) / scale).astype(np.uint8)
+        return head + AFFINE.pack(scale, low) + wire.header(Y), Y
+    elif name == 'zlib':
+        return head, zlib.compress(wire.dumps(X), 1)
+    elif name == 'sparse':
+        flat = X.reshape(-1)
+        mask = flat != 0
+        return head + wire.header(X), np.concatenate([np.packbits(mask), flat[mask].view(np.uint8)])
+    raise ValueError('unknown codec {}'.format(name))
+
+
+def size(head, body):
+    """ Number of bytes of encoded packet. """
+    return len(head) + (body.nbytes if isinstance(body, np.ndarray) else len(body))
+
+
+def join(head, body):
+    """ Join encoded packet into byte string, used by Avro bytes field. """
+    return head + (body.tobytes() if isinstance(body, np.ndarray) else body)
+
+
+def pointer(path, offset, size):
+    """
+        Packet pointing to an encoded packet in shared memory.
+
+        Args:
+            path: Path of mapped file.
+            offset: Offset of packet in file.
+            size: Size of packet.
+
+        Returns:
+            Byte string of pointer packet.
+    """
+    return CODEC.pack('shm', '') + SHM.pack(offset, size) + path
+
+
+def dumps(X, name='raw'):
+    """ Encode array into byte string. """
+    return join(*encode(X, name))
+
+
+def decode(buf, offset=0, size=None):
+    """
+        Decode packet. A raw packet is decoded without copy, so the array is a
+        view of buf, or of shared memory for a shm packet.
+
+        Args:
+            buf: Byte string or bytearray holding the packet.
+            offset: Start of packet in buf.
+            size: Size of packet in buf, default to the rest of buf.
+
+        Returns:
+            numpy array with original dtype.
+
+        Raises:
+            ValueError: if codec is unknown.
+    """
+    end = len(buf) if size is None else offset + size
+    name, dtype = CODEC.unpack_from(buf, offset)
+    name = name.rstrip(b'\0')
+    offset += CODEC.size
+    if name == 'shm':
+        start, length = SHM.unpack_from(buf, offset)
+        return decode(shm.attach(bytes(buf[offset + SHM.size:end])), start, length)
+
+    dtype = np.dtype(dtype.rstrip(b'\0'))
+    if name == 'raw':
+        return wire.loads(buf, offset, end - offset)
+    elif name == 'float16':
+        return wire.loads(buf, offset, end - offset).astype(dtype)
+    elif name == 'int8':
+        scale, low = AFFINE.unpack_from(buf, offset)
+        offset += AFFINE.size
+        X = wire.loads(buf, offset, end - offset).astype(np.float32) * scale + low
+        return np.rint(X).astype(dtype) if dtype.kind in 'iu' else X.astype(dtype)
+    elif name == 'zlib':
+        return wire.loads(zlib.decompress(bytes(buf[offset:end])))
+    elif name == 'sparse':
+        dtype, shape, offset = wire.unpack_header(buf, offset)
+        count = int(np.prod(shape))
+        nbits = (count + 7) // 8
+        mask = np.unpackbits(np.frombuffer(buf, np.uint8, nbits, offset))[:count].astype(bool)
+        offset += nbits
+        X = np.zeros(count, dtype)
+        X[mask] = np.frombuffer(buf, dtype, (end - offset) // dtype.itemsize, offset)
+        return X.reshape(shape)
+    raise ValueError('unknown codec {}'.format(name))
+
+
+class EdgeStat(object):
+    """
+        Statistics of packets sent on one edge, shows the sparsity seen and
+        bytes saved by codec.
+
+        Attributes:
+            count: Number of packets.
+            zeros: Total sparsity of packets.
+            raw: Total bytes of tensors before encoding.
+            sent: Total bytes of encoded packets.
+            lock: Threading lock for counters.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.zeros = 0.0
+        self.raw = 0
+        self.sent = 0
+        self.lock = Lock()
+
+    def add(self, X, zeros, head, body):
+        with self.lock:
+            self.count += 1
+            self.zeros += zeros
+            self.raw += X.nbytes
+            self.sent += size(head, body)
+
+    def report(self):
+        with self.lock:
+            if self.count == 0:
+                return 'sparsity: n/a'
+            return 'sparsity: {:.1%}, bytes: {:d} -> {:d} ({:.1%} saved)'.format(
+                self.zeros / self.count, self.raw / self.count, self.sent / self.count,
+                1.0 - float(self.sent) / self.raw if self.raw > 0 else 0.0)
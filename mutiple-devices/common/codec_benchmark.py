@@ -0,0 +1,125 @@
+"""
+    This module compares activation codecs. It runs the whole pipeline on one
+    machine, every activation passes through the codec of its edge as it would
+    between devices, and the output is compared with the uncompressed
+    model.predict result.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import codec
+import model as ml
+import topology
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def pipeline():
+    """
+        Layers in order with model builder of each device and how their outputs
+        are joined, from topology. A layer after a fan-out has a device for each
+        partition and a split layer a device for each slice, they all get the
+        same input. The merge layer concatenates their outputs, or sums them
+        after a layer split with sum.
+    """
+    layers, copies = [], 1
+    for stage in topology.load().stages.values():
+        copies = 1 if stage.merge > 1 else copies
+        if stage.split is not None:
+            builders = [stage.builder(ml, part) for part in range(stage.parts)]
+        else:
+            builders = [stage.builder(ml)] * copies
+        layers.append((stage.name, builders, stage.reduce))
+        copies = stage.fanout if stage.fanout > 1 else copies
+    return layers
+
+
+PIPELINE = pipeline()
+
+
+def transfer(inputs, name, stat, copies=1, reduce='concat'):
+    """
+        Pass the inputs of a layer through codec of the edge.
+
+        Args:
+            inputs: List of arrays sent to layer.
+            name: Codec name.
+            stat: A dictionary accumulates bytes and codec time.
+            copies: Number of devices each array is sent to.
+            reduce: How several arrays are joined, concat or sum.
+
+        Returns:
+            Input array of the layer.
+    """
+    outputs = []
+    for X in inputs:
+        start = time.time()
+        packet = codec.dumps(X, name)
+        outputs.append(codec.decode(packet))
+        stat['time'] += time.time() - start
+        stat['bytes'] += len(packet) * copies
+    if len(outputs) == 1:
+        return outputs[0]
+    return np.sum(outputs, axis=0) if reduce == 'sum' else np.concatenate(outputs)
+
+
+def run(models, image, codecs, stats):
+    """
+        Run pipeline for one image.
+
+        Args:
+            models: A dictionary maps layer name to list of models.
+            image: Input image.
+            codecs: A dictionary maps layer name to codec of its input edge.
+            stats: A dictionary maps layer name to transfer statistics.
+
+        Returns:
+            Output of last layer.
+    """
+    inputs = [image]
+    for name, _, reduce in PIPELINE:
+        X = transfer(inputs, codecs.get(name, 'raw'), stats[name], len(models[name]), reduce)
+        inputs = [model.predict(np.array([X]))[0] for model in models[name]]
+    return transfer(inputs, codecs.get('initial', 'raw'), stats['initial'])
+
+
+def main(cmd):
+    models = dict()
+    for name, builders, _ in PIPELINE:
+        models[name] = [builder() for builder in builders]
+    first = topology.load(table=None).first
+    images = [(np.random.rand(*first.shape) * 255).astype(first.dtype) for _ in range(cmd.frames)]
+    edges = [name for name, _, _ in PIPELINE] + ['initial']
+
+    empty = dict((edge, {'bytes': 0, 'time': 0.0}) for edge in edges)
+    reference = [run(models, image, dict(), empty) for image in images]
+
+    for name in cmd.codecs:
+        stats = dict((edge, {'bytes': 0, 'time': 0.0}) for edge in edges)
+        outputs = [run(models, image, dict.fromkeys(edges, name), stats) for image in images]
+        error = max(np.abs(output - ref).max() for output, ref in zip(outputs, reference))
+        top1 = np.mean([output.argmax() == ref.argmax() for output, ref in zip(outputs, reference)])
+        total = sum(stats[edge]['bytes'] for edge in edges) / cmd.frames
+        print '{:8s} {:>10d} bytes/frame ({:.1%}), max error: {:.2e}, top-1 agree: {:.1%}'.format(
+            name, total, total / float(sum(empty[edge]['bytes'] for edge in edges) / cmd.frames),
+            error, top1)
+        for edge in edges:
+            print '    {:12s} {:>10d} bytes, codec time: {:.3f} sec'.format(
+                edge, stats[edge]['bytes'] / cmd.frames, stats[edge]['time'] / cmd.frames)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--frames', type=int, default=10,
+                        help='number of frames')
+    parser.add_argument('-c', '--codecs', nargs='+', default=list(codec.CODECS),
+                        choices=codec.CODECS, help='codecs to compare')
+    cmd = parser.parse_args()
+    main(cmd)
@@ -0,0 +1,255 @@
+"""
+    This module collects metrics of all nodes in the IP table and finds the
+    stage that caps throughput of the pipeline. It runs next to initial.py and
+    prints a summary of every stage every few seconds.
+
+    Each node serves its metrics on its port + 1000. Between two scrapes the
+    collector takes for each replica of a stage:
+
+        arrival: Inputs run or dropped by overflow per second.
+        service: Inputs the replica runs per second when all its workers are busy,
+                inputs run divided by busy time of workers, times number of workers.
+
+    Utilisation of a stage is its arrival rate over its service rate, summed
+    over replicas. The stage with the highest utilisation is the bottleneck,
+    and it needs enough replicas to bring utilisation under the target. A stage
+    that blocks its previous layer can not see more arrivals than it serves, so
+    a saturated stage shows about 100%. Pass --fps to plan for a frame rate
+    instead of the rate the pipeline reaches now.
+"""
+import argparse
+import math
+import os
+import re
+import sys
+import time
+import urllib2
+from collections import OrderedDict
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import topology
+from pool import split
+
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """
+        Parse Prometheus text format.
+
+        Returns:
+            A dictionary maps (metric name, sorted label pairs) to value.
+    """
+    samples = dict()
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, _, value = line.rpartition(' ')
+        name, _, labels = series.partition('{')
+        samples[(name, tuple(sorted(LABEL.findall(labels))))] = float(value)
+    return samples
+
+
+def quantile(buckets, q):
+    """
+        Quantile of histogram.
+
+        Args:
+            buckets: List of (upper bound, cumulative count) in bound order.
+            q: Quantile between 0 and 1.
+
+        Returns:
+            Upper bound of the bucket holding the quantile, None if there is no value.
+    """
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    for bound, count in buckets:
+        if count >= q * buckets[-1][1]:
+            return bound
+
+
+class Replica(object):
+    """
+        Metrics of one node running a stage.
+
+        Attributes:
+            stage: Name of the stage.
+            host: IP address of node.
+            port: Metrics port of node.
+            last: Time and samples of last scrape, None before first scrape.
+            delta: Time between last two scrapes and a dictionary maps samples to their
+                    change, None until two scrapes.
+            up: Flag if last scrape succeeded.
+    """
+
+    def __init__(self, stage, host, port):
+        self.stage = stage
+        self.host = host
+        self.port = port
+        self.last = None
+        self.delta = None
+        self.up = False
+
+    def scrape(self, timeout):
+        now = time.time()
+        try:
+            samples = parse(urllib2.urlopen('http://{:s}:{:d}/metrics'.format(self.host, self.port),
+                                            timeout=timeout).read())
+        except Exception:
+            self.up = False
+            return
+        if self.last is not None:
+            before = self.last[1]
+            # a counter lower than before means the node restarted.
+            self.delta = (now - self.last[0], dict(
+                (key, value - before.get(key, 0.0) if value >= before.get(key, 0.0) else value)
+                for key, value in samples.items()))
+        self.last = (now, samples)
+        self.up = True
+
+    def value(self, name, **labels):
+        """ Value of a sample in last scrape, 0 if it is missing. """
+        return self.last[1].get((name, tuple(sorted(labels.items()))), 0.0) if self.last else 0.0
+
+    def change(self, name, **labels):
+        """ Change of a sample between last two scrapes, summed over other labels. """
+        labels = set(labels.items())
+        return sum(value for (key, pairs), value in self.delta[1].items()
+                   if key == name and labels.issubset(pairs))
+
+    def buckets(self, name):
+        """ Change of histogram buckets of the stage between last two scrapes. """
+        buckets = [(float(dict(pairs)['le']), value) for (key, pairs), value in self.delta[1].items()
+                   if key == name + '_bucket' and ('stage', self.stage) in pairs]
+        return sorted(buckets)
+
+
+class Collector(object):
+    """
+        Metrics of all stages in IP table.
+
+        Attributes:
+            stages: An ordered dictionary maps stage name to list of replicas.
+            target: Utilisation the number of replicas is planned for.
+            fps: Frame rate the number of replicas is planned for, 0 for the rate
+                    the pipeline reaches now.
+            timeout: Seconds to wait for a node to answer.
+    """
+
+    def __init__(self, stages, target=0.8, fps=0.0, timeout=2.0):
+        self.stages = stages
+        self.target = target
+        self.fps = fps
+        self.timeout = timeout
+
+    def scrape(self):
+        for replicas in self.stages.values():
+            for replica in replicas:
+                replica.scrape(self.timeout)
+
+    def summary(self, name):
+        """
+            Summary of a stage from the last two scrapes.
+
+            Returns:
+                A dictionary of arrival and service rate in inputs per second,
+                utilisation, queue depth, 95th percentile of queue and predict
+                time, dropped frames, replicas up and frames sent to initializer
+                per second. Rates are None if no replica has run a batch.
+        """
+        replicas = [replica for replica in self.stages[name] if replica.up and replica.delta is not None]
+        result = {'up': len(replicas), 'arrival': 0.0, 'service': 0.0, 'depth': 0, 'dropped': 0,
+                  'completed': 0.0, 'queue': None, 'predict': None}
+        queue, predict = dict(), dict()
+        for replica in replicas:
+            interval = replica.delta[0]
+            processed = replica.change('node_processed_total', stage=name)
+            busy = replica.change('node_busy_seconds_total', stage=name)
+            overflow = replica.change('node_dropped_total', reason='overflow')
+            workers = replica.value('node_workers', stage=name) or 1
+            result['arrival'] += (processed + overflow) / interval
+            result['service'] += processed / busy * workers if busy > 0 else 0.0
+            result['depth'] += int(replica.value('node_queue_depth', stage=name))
+            result['dropped'] += int(replica.change('node_dropped_total'))
+            result['completed'] += replica.change('node_sent_total', next='initial') / interval
+            for buckets, histogram in ((queue, 'node_queue_seconds'), (predict, 'node_predict_seconds')):
+                for bound, count in replica.buckets(histogram):
+                    buckets[bound] = buckets.get(bound, 0.0) + count
+        result['queue'] = quantile(sorted(queue.items()), 0.95)
+        result['predict'] = quantile(sorted(predict.items()), 0.95)
+        if result['service'] <= 0:
+            result['arrival'] = result['service'] = None
+        return result
+
+    def report(self):
+        summaries = OrderedDict((name, self.summary(name)) for name in self.stages)
+        completed = sum(summary['completed'] for summary in summaries.values())
+        lines = ['{:>12s} {:>8s} {:>10s} {:>10s} {:>7s} {:>6s} {:>10s} {:>10s} {:>8s}'.format(
+            'stage', 'replicas', 'arrival/s', 'service/s', 'util', 'queue', 'p95 wait', 'p95 infer', 'dropped')]
+        bottleneck, highest = None, 0.0
+        for name, summary in summaries.items():
+            if summary['service'] is None:
+                lines.append('{:>12s} {:>3d}/{:<4d} {:>10s}'.format(name, summary['up'], len(self.stages[name]),
+                                                                   'n/a'))
+                continue
+            utilisation = summary['arrival'] / summary['service']
+            if utilisation > highest:
+                bottleneck, highest = name, utilisation
+            lines.append('{:>12s} {:>3d}/{:<4d} {:>10.1f} {:>10.1f} {:>6.0%} {:>6d} {:>10s} {:>10s} {:>8d}'.format(
+                name, summary['up'], len(self.stages[name]), summary['arrival'], summary['service'],
+                utilisation, summary['depth'], milliseconds(summary['queue']), milliseconds(summary['predict']),
+                summary['dropped']))
+        lines.append('completed: {:.1f} fps'.format(completed))
+        if bottleneck is not None:
+            replicas = summaries[bottleneck]['up']
+            # load grows with the frame rate planned for.
+            load = highest * (self.fps / completed if self.fps > 0 and completed > 0 else 1.0)
+            needed = int(math.ceil(replicas * load / self.target))
+            lines.append('bottleneck: {:s} at {:.0%} utilisation, needs {:d} replicas ({:d} more) for {:.0%}{:s}'.format(
+                bottleneck, highest, needed, max(0, needed - replicas), self.target,
+                ' at {:.1f} fps'.format(self.fps) if self.fps > 0 else ''))
+        return '\n'.join(lines)
+
+
+def milliseconds(value):
+    """ Upper bound of a percentile in milliseconds. """
+    if value is None:
+        return 'n/a'
+    return '<{:.1f}ms'.format(1000 * value) if value != float('inf') else 'inf'
+
+
+def main(cmd):
+    # read stages in pipeline order and their devices from config files
+    pipeline = topology.load()
+    stages = OrderedDict()
+    for name in pipeline.stages:
+        stages[name] = []
+        for addr in pipeline.replicas.get(name, []):
+            host, port = split(addr, 12345)
+            stages[name].append(Replica(name, host, port + cmd.offset))
+
+    collector = Collector(stages, cmd.target, cmd.fps, cmd.timeout)
+    collector.scrape()
+    while True:
+        time.sleep(cmd.interval)
+        collector.scrape()
+        print collector.report()
+        print
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--interval', type=float, default=5.0,
+                        help='seconds between summaries')
+    parser.add_argument('--offset', type=int, default=1000,
+                        help='metrics port of a node minus its port')
+    parser.add_argument('--target', type=float, default=0.8,
+                        help='utilisation the number of replicas is planned for')
+    parser.add_argument('--fps', type=float, default=0.0,
+                        help='frame rate the number of replicas is planned for, rate reached now by default')
+    parser.add_argument('--timeout', type=float, default=2.0,
+                        help='seconds to wait for a node to answer')
+    cmd = parser.parse_args()
+    main(cmd)
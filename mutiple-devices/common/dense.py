@@ -0,0 +1,247 @@
+"""
+    This module runs stages of dense layers with numpy instead of TensorFlow,
+    so a node of fully connected stages starts without importing TensorFlow
+    or Keras at all.
+
+    The layers of a stage are read from the Keras architecture the weight store
+    keeps next to its weights (model.json), and the weights are mapped from the
+    store. Each dense layer is one matrix product by the BLAS numpy is linked
+    against, written into arrays kept for each thread and batch size, followed
+    by bias and activation in place.
+
+    The kernel of a dense layer can be quantized to int8 with a scale for each
+    output neuron, which holds a quarter of the memory of float32 weights. It
+    is turned back into float32 a block of rows at a time into a small kept
+    array, so only int8 weights are read from memory and the product still runs
+    in BLAS. Scales of output neurons are applied to the output once.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+import weights
+
+# bytes of float32 kernel rows turned back from int8 at once, they should stay in cache.
+BLOCK = 2 ** 18
+
+
+def relu(X):
+    np.maximum(X, 0, out=X)
+
+
+def softmax(X):
+    X -= X.max(axis=-1, keepdims=True)
+    np.exp(X, out=X)
+    X /= X.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {'linear': lambda X: None, 'relu': relu, 'softmax': softmax}
+
+
+def activation(name):
+    if name not in ACTIVATIONS:
+        raise ValueError('activation {} is not supported by numpy engine'.format(name))
+    return ACTIVATIONS[name]
+
+
+def quantize(kernel, rows):
+    """
+        Quantize kernel to int8 with a symmetric scale for each output neuron,
+        a block of rows at a time so the float32 kernel is never copied whole.
+
+        Returns:
+            Tuple of int8 kernel and float32 scale of each column.
+    """
+    scale = np.zeros(kernel.shape[1], dtype=np.float32)
+    for first in range(0, len(kernel), rows):
+        np.maximum(scale, np.abs(kernel[first:first + rows]).max(axis=0), out=scale)
+    scale /= 127
+    scale[scale == 0] = 1
+    result = np.empty(kernel.shape, dtype=np.int8)
+    for first in range(0, len(kernel), rows):
+        result[first:first + rows] = np.rint(kernel[first:first + rows] / scale)
+    return result, scale
+
+
+class Dense(object):
+    """
+        Dense layer.
+
+        Attributes:
+            kernel: Kernel of input by output neurons, float32 or int8.
+            bias: Bias of output neurons, None without bias.
+            scale: Scale of each output neuron of int8 kernel, None for float32.
+            activation: Function applies activation to an array in place.
+            rows: Number of kernel rows turned back from int8 at once.
+            units: Number of output neurons.
+    """
+
+    def __init__(self, kernel, bias, activation, int8=False):
+        self.units = kernel.shape[1]
+        self.rows = max(1, BLOCK // (4 * self.units))
+        if int8:
+            self.kernel, self.scale = quantize(kernel, self.rows)
+        else:
+            self.kernel, self.scale = kernel, None
+        self.bias = None if bias is None else np.array(bias, dtype=np.float32)
+        self.activation = activation
+
+    def shape(self, shape):
+        return (self.units,)
+
+    def __call__(self, X, out, array):
+        """
+            Output of a batch.
+
+            Args:
+                X: Input of batch size by input neurons.
+                out: Array the output is written into.
+                array: Function gives kept array of this thread for a kind and shape.
+        """
+        if self.scale is None:
+            np.dot(X, self.kernel, out=out)
+        else:
+            block = array(('rows', id(self)), (self.rows, self.units))
+            partial = array(('partial', id(self)), out.shape)
+            out[...] = 0
+            for first in range(0, len(self.kernel), self.rows):
+                last = min(first + self.rows, len(self.kernel))
+                rows = block[:last - first]
+                rows[...] = self.kernel[first:last]
+                np.dot(X[:, first:last], rows, out=partial)
+                out += partial
+            out *= self.scale
+        if self.bias is not None:
+            out += self.bias
+        self.activation(out)
+        return out
+
+
+class Activation(object):
+    """ Activation layer. """
+
+    def __init__(self, activation):
+        self.activation = activation
+
+    def shape(self, shape):
+        return shape
+
+    def __call__(self, X, out, array):
+        out[...] = X
+        self.activation(out)
+        return out
+
+
+class Flatten(object):
+    """ Flatten layer. """
+
+    def shape(self, shape):
+        return (int(np.prod(shape)),)
+
+    def __call__(self, X, out, array):
+        out[...] = X.reshape(out.shape)
+        return out
+
+
+class DenseModel(object):
+    """
+        Model of a stage run by numpy, it predicts like runner.Runner.
+
+        Attributes:
+            layers: Layers in order.
+            shapes: Input shape of each layer without batch axis, followed by
+                    output shape.
+            dtype: Numpy data type of model input.
+            shape: Input shape without batch axis.
+            output_shape: Output shape without batch axis.
+            local: Thread local arrays of each kind and shape.
+    """
+
+    def __init__(self, layers, shape):
+        self.layers = layers
+        self.shapes = [tuple(shape)]
+        for layer in layers:
+            self.shapes.append(layer.shape(self.shapes[-1]))
+        self.dtype = np.float32
+        self.shape = self.shapes[0]
+        self.output_shape = self.shapes[-1]
+        self.local = threading.local()
+
+    def predict(self, X, out=None):
+        """
+            Output of a batch.
+
+            Args:
+                X: Input array with batch axis.
+                out: Array the output is written into, a new array if None.
+
+            Returns:
+                Output array.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if out is None:
+            out = np.empty((len(X),) + self.output_shape, dtype=np.float32)
+        for k, layer in enumerate(self.layers):
+            if k + 1 < len(self.layers):
+                Y = self.array(('layer', k), (len(X),) + self.shapes[k + 1])
+            else:
+                Y = out
+            X = layer(X, Y, self.array)
+        return out
+
+    def array(self, kind, shape, dtype=np.float32):
+        arrays = self.local.__dict__.setdefault('arrays', dict())
+        if (kind, shape) not in arrays:
+            arrays[(kind, shape)] = np.empty(shape, dtype=dtype)
+        return arrays[(kind, shape)]
+
+    def inputs(self, size, shape=None):
+        """ Input array of this thread for a batch size, in input shape unless shape is given. """
+        return self.array('input', (size,) + tuple(shape or self.shape), self.dtype)
+
+    def outputs(self, size, shape=None):
+        """ Output array of this thread for a batch size, in output shape unless shape is given. """
+        return self.array('output', (size,) + tuple(shape or self.output_shape))
+
+
+def load(root, stage, part=0, int8=False):
+    """
+        Model of a stage from weight store.
+
+        Args:
+            root: Directory of weight store.
+            stage: Stage of the model.
+            part: Slice of a split stage.
+            int8: Flag for quantizing dense kernels to int8.
+
+        Returns:
+            DenseModel.
+
+        Raises:
+            IOError: if the store has no architecture of the stage.
+            ValueError: if the stage has a layer numpy engine does not run.
+    """
+    path = os.path.join(weights.path(root, stage, part), 'model.json')
+    if not os.path.exists(path):
+        raise IOError('no model of {} in {}, write weight store again'.format(stage.name, path))
+    with open(path) as file:
+        config = json.load(file)['config']
+    arrays = weights.read(root, stage, part)
+    shape, layers = None, []
+    for layer in config['layers']:
+        kind, args = layer['class_name'], layer['config']
+        if kind == 'InputLayer':
+            shape = args['batch_input_shape'][1:]
+        elif kind == 'Dense':
+            kernel = arrays.pop(0)
+            bias = arrays.pop(0) if args['use_bias'] else None
+            layers.append(Dense(kernel, bias, activation(args['activation']), int8))
+        elif kind == 'Activation':
+            layers.append(Activation(activation(args['activation'])))
+        elif kind == 'Flatten':
+            layers.append(Flatten())
+        else:
+            raise ValueError('{} of {} is not supported by numpy engine'.format(kind, stage.name))
+    return DenseModel(layers, shape)
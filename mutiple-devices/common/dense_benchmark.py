@@ -0,0 +1,103 @@
+"""
+    This module compares the numpy engine of dense.py, with float32 and int8
+    kernels, against the TensorFlow model of each dense stage, one slice of a
+    split stage. Models are read from the weight store. For each engine it
+    prints the seconds to load the model, the milliseconds per batch of random
+    input, the MB of kernels held, the largest difference from TensorFlow and
+    how often the largest output matches it.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import dense
+import model as ml
+import runner
+import topology
+import weights
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def timeit(call, runs):
+    call()
+    start = time.time()
+    for _ in range(runs):
+        call()
+    return (time.time() - start) / runs
+
+
+def kernels(model):
+    """ MB of dense kernels of a numpy engine model, None for TensorFlow. """
+    if not isinstance(model, dense.DenseModel):
+        return None
+    return sum(layer.kernel.nbytes for layer in model.layers if isinstance(layer, dense.Dense)) / 2.0 ** 20
+
+
+def compare(root, stage, size, runs):
+    """
+        Run a stage on each engine.
+
+        Returns:
+            List of tuples of engine name, seconds to load, seconds per batch,
+            MB of kernels, largest difference and top-1 agreement with TensorFlow.
+    """
+    X = np.random.rand(100, *stage.shape).astype(np.float32)
+    engines = []
+    for int8 in [False, True]:
+        start = time.time()
+        model = dense.load(root, stage, int8=int8)
+        engines.append(('int8' if int8 else 'float32', time.time() - start, model))
+    start = time.time()
+    reference = runner.Runner(weights.builder(root, stage, ml)())
+    engines.insert(0, ('tensorflow', time.time() - start, reference))
+
+    expect = reference.predict(X)
+    result = []
+    for name, load, model in engines:
+        batch = model.inputs(size)
+        batch[...] = X[:size]
+        Y = np.concatenate([model.predict(X[k:k + size]) for k in range(0, len(X), size)])
+        result.append((name, load, timeit(lambda: model.predict(batch), runs), kernels(model),
+                       np.abs(Y - expect).max(), np.mean(Y.argmax(axis=-1) == expect.argmax(axis=-1))))
+    return result
+
+
+def main(cmd):
+    stages = topology.load().stages
+    print '{:>10s} {:>6s} {:>11s} {:>8s} {:>10s} {:>10s} {:>10s} {:>7s}'.format(
+        'stage', 'batch', 'engine', 'load s', 'ms', 'kernel MB', 'max diff', 'top-1')
+    for name in cmd.stages or stages.keys():
+        stage = stages[name]
+        if stage.dtype != np.float32:
+            continue
+        for size in cmd.batch:
+            try:
+                rows = compare(cmd.weights, stage, size, cmd.runs)
+            except ValueError, e:
+                print '{:>10s}: {}'.format(name, e)
+                break
+            for engine, load, seconds, size_mb, error, top in rows:
+                print '{:>10s} {:>6d} {:>11s} {:>8.3f} {:>10.3f} {:>10s} {:>10.2e} {:>6.0%}'.format(
+                    name, size, engine, load, seconds * 1e3, '-' if size_mb is None else '{:.1f}'.format(size_mb),
+                    error, top)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--weights', metavar='DIR', default='resource/weights',
+                        help='weight store written by weights.py')
+    parser.add_argument('-s', '--stages', nargs='+',
+                        help='stages to compare, all float32 input stages in topology by default')
+    parser.add_argument('-b', '--batch', type=int, nargs='+', default=[1],
+                        help='batch sizes to compare')
+    parser.add_argument('-r', '--runs', type=int, default=20,
+                        help='number of calls to time')
+    cmd = parser.parse_args()
+    main(cmd)
@@ -0,0 +1,146 @@
+"""
+    This module caches the model of each stage as a frozen graph, so a node
+    restart does not build Keras layers and the TensorFlow graph again.
+
+    A stage model is built once in a graph of its own, its variables are
+    turned into constants and the graph is optimized for inference: unused
+    ops are pruned, identity ops removed and constant subgraphs folded. The
+    graph is saved in the cache directory under a key of everything it is
+    built from: model builder and its arguments, slice of a split stage, input
+    shape, precision, source of model.py and of this module, weight files of the stage
+    and versions of TensorFlow and Keras. Weight files are compared by size and modification
+    time, so rewriting the weight store invalidates the graph. A graph of the
+    same stage with another key is deleted when a new one is saved.
+"""
+import hashlib
+import inspect
+import json
+import os
+import sys
+
+import keras
+import tensorflow as tf
+from keras import backend as K
+from tensorflow.tools.graph_transforms import TransformGraph
+
+import tiling
+import weights
+
+TRANSFORMS = ['strip_unused_nodes', 'remove_nodes(op=Identity)', 'fold_constants(ignore_errors=true)',
+              'fold_batch_norms', 'sort_by_execution_order']
+
+
+class FrozenModel(object):
+    """
+        Model of a frozen graph, it predicts like a Keras model.
+
+        Attributes:
+            graph: Graph the frozen graph is imported into.
+            session: Session of the graph.
+            input: Input tensor.
+            output: Output tensor.
+            input_shape: Input shape like Keras model, frozen graphs lose some shapes.
+            output_shape: Output shape like Keras model.
+    """
+
+    def __init__(self, graph_def, names):
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.session = tf.Session(graph=self.graph)
+        self.input = self.graph.get_tensor_by_name(names['input'] + ':0')
+        self.output = self.graph.get_tensor_by_name(names['output'] + ':0')
+        self.input_shape = tuple(names['input_shape'])
+        self.output_shape = tuple(names['output_shape'])
+
+    def predict(self, X):
+        """ Output of a batch, sessions can be run by several threads at once. """
+        return self.session.run(self.output, {self.input: X})
+
+
+def source(module):
+    return hashlib.sha1(inspect.getsource(module)).hexdigest()
+
+
+def key(stage, part, module, store=None):
+    """
+        Everything a frozen graph of a stage is built from.
+
+        Args:
+            stage: Stage of the model.
+            part: Slice of a split stage.
+            module: Module with model builders.
+            store: Directory of weight store, None for random weights.
+    """
+    files = []
+    if store is not None:
+        directory = weights.path(store, stage, part)
+        for name in sorted(os.listdir(directory)):
+            stat = os.stat(os.path.join(directory, name))
+            files.append([name, stat.st_size, stat.st_mtime])
+    return {'model': stage.model, 'args': stage.args, 'part': part if stage.split else None,
+            'parts': stage.parts, 'shape': list(stage.shape), 'precision': stage.precision,
+            'source': [source(module), source(sys.modules[__name__])] +
+                      ([source(tiling)] if stage.tiles > 1 else []),
+            'weights': files, 'tensorflow': tf.__version__, 'keras': keras.__version__}
+
+
+def freeze(builder):
+    """
+        Build a model in a graph of its own and freeze it.
+
+        Returns:
+            Tuple of optimized graph definition and a dictionary of input and
+            output op names and shapes.
+    """
+    with tf.Graph().as_default(), tf.Session().as_default() as session:
+        model = builder()
+        # Keras initializes variables of the default session it has not set.
+        K.get_session()
+        names = {'input': model.input.op.name, 'output': model.output.op.name,
+                 'input_shape': model.input_shape, 'output_shape': model.output_shape}
+        graph_def = tf.graph_util.convert_variables_to_constants(session, session.graph.as_graph_def(),
+                                                                 [names['output']])
+    graph_def = tf.graph_util.remove_training_nodes(graph_def)
+    return TransformGraph(graph_def, [names['input']], [names['output']], TRANSFORMS), names
+
+
+def load(root, name, key, builder):
+    """
+        Frozen model from cache, or frozen from builder and saved to cache.
+
+        Args:
+            root: Cache directory.
+            name: Stage name, with slice of a split stage.
+            key: Dictionary of everything the model is built from.
+            builder: Function builds the Keras model.
+
+        Returns:
+            FrozenModel.
+    """
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True)).hexdigest()[:16]
+    path = os.path.join(root, '{:s}-{:s}.pb'.format(name, digest))
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            graph_def = tf.GraphDef.FromString(file.read())
+        with open(path + '.json') as file:
+            names = json.load(file)
+        print 'frozen graph of {:s} loaded from {:s}'.format(name, path)
+        return FrozenModel(graph_def, names)
+
+    graph_def, names = freeze(builder)
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    for old in os.listdir(root):
+        if old.startswith(name + '-') and old.endswith('.pb'):
+            os.remove(os.path.join(root, old))
+            if os.path.exists(os.path.join(root, old + '.json')):
+                os.remove(os.path.join(root, old + '.json'))
+    # written under a temporary name first, so a node never reads half a file.
+    with open(path + '.json', 'w') as file:
+        json.dump(dict(names, key=key), file, indent=4, sort_keys=True)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(graph_def.SerializeToString())
+    os.rename(path + '.tmp', path)
+    print 'frozen graph of {:s} saved to {:s}'.format(name, path)
+    return FrozenModel(graph_def, names)
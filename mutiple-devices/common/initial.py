@@ -0,0 +1,421 @@
+"""
+    This module is called initial because it initializes all request
+    from this node. It will simulates a (224, 224, 3) size image data
+    packet and send to the first node in the distributed system and wait
+    for the response from the last layer.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+from functools import partial
+from multiprocessing import Queue
+from threading import Thread, Lock
+
+import avro.ipc as ipc
+import avro.protocol as protocol
+import avro.schema as schema
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import clock
+import codec
+import rate
+import shm
+import stage
+import topology
+import tracing
+import wire
+from pool import AvroConnection, ConnectionPool, CONNECTION_ERRORS, split
+
+# data packet format definition
+PROTOCOL = protocol.parse(open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             'resource', 'image.avpr')).read())
+
+
+class Initializer:
+    """
+        Singleton factory for initializer. The Initializer module has two timers.
+        The node_timer is for recording statistics for first layer model inference
+        time. The timer is for recording the total inference time from last
+        fully connected layer.
+
+        Attributes:
+            queue: Queue for storing available first layer devices.
+            start: Start time of getting a frame.
+            count: Total Number of frames gets back.
+            node_total: Total layer-wise time.
+            node_count: Total layer-wise frame count.
+            transport: Transport to other devices, avro or raw tcp.
+            codec: Codec used on the edge to first layer.
+            pool: Persistent connections to first layer devices.
+            ring: Shared memory ring buffer for first layer on the same host, None
+                    if shared memory is disabled.
+            executor: Sender threads with bounded queue of frames waiting to be sent.
+            controller: Frame rate controller.
+            trace: Latency statistics of stages and links from trace records.
+            clock: Clock offset and round trip time of first layer devices.
+            produced: Number of frames produced.
+            sent: Number of frames sent to first layer.
+            completed: Number of results got back.
+            lock: Threading lock for counters.
+            topology: Stages of the pipeline with their devices.
+            tiling: Rows of each strip if first layer is tiled, otherwise None.
+    """
+    instance = None
+
+    def __init__(self):
+        self.queue = Queue()
+        self.start = 0.0
+        self.count = 0
+        self.node_total = 0
+        self.node_count = 1
+        self.transport = 'avro'
+        self.codec = 'raw'
+        self.pool = ConnectionPool(partial(AvroConnection, PROTOCOL))
+        self.ring = None
+        self.executor = None
+        self.controller = rate.RateController()
+        self.trace = tracing.TraceStat()
+        self.clock = clock.ClockTable()
+        self.produced = 0
+        self.sent = 0
+        self.completed = 0
+        self.lock = Lock()
+        self.topology = None
+        self.tiling = None
+
+    def add(self, counter):
+        """ Increase counter by name. """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def report(self):
+        with self.lock:
+            return 'produced: {:d}, sent: {:d}, dropped: {:d}, completed: {:d}'.format(
+                self.produced, self.sent, self.executor.dropped, self.completed)
+
+    def timer(self):
+        # count == 0 then means the node just starts, so start the timer.
+        if self.count == 0:
+            self.start = time.time()
+        else:
+            print 'total time: {:.3f} sec, {:s}'.format((time.time() - self.start) / self.count, self.report())
+            if self.count % 100 == 0:
+                print self.trace.report()
+        self.count += 1
+
+    def node_timer(self, mode, interval):
+        """
+            Print out time used by a specific module.
+
+            Args:
+                mode: A string for node mode.
+                interval: A float for time lapse.
+        """
+        self.node_total += interval
+        print '{:s}: {:.3f}, {:s}'.format(mode, self.node_total / self.node_count, self.pool.report())
+        self.node_count += 1
+
+    @classmethod
+    def create_init(cls):
+        """ Utilize singleton design pattern to create single instance. """
+        if cls.instance is None:
+            cls.instance = Initializer()
+        return cls.instance
+
+
+def send_request(X, mode, frame_id, trace, part=0):
+    """
+        This function sends data to next layer. It will pop an available
+        next layer device IP address defined at IP table, and send data
+        to that IP. After, it will put the available IP back. The connection
+        to that IP is kept in pool and reused for next frame.
+
+        Args:
+            X: The image numpy array.
+            mode: Specify next layer option.
+            frame_id: Id of frame, carried by every layer up to the result.
+            trace: Trace record of the frame.
+            part: Strip index if first layer is tiled.
+    """
+    init = Initializer.create_init()
+    queue = init.queue
+
+    init.controller.start(frame_id)
+    # initializer has no model, so model inference takes no time.
+    trace.mark('start', 'predict')
+    head, body = codec.encode(X, init.codec)
+    trace.mark('encode')
+
+    addr = queue.get()
+    host, port = split(addr, 12345)
+    init.clock.watch((host, port))
+    trace.hops[-1]['offset'] = init.clock.offset((host, port))
+    region = None
+    if init.ring is not None and shm.local(host):
+        region, size = init.ring.write(head, body)
+        head, body = codec.pointer(init.ring.path, region, size), b''
+    trace.mark('send')
+    start = time.time()
+    try:
+        if init.transport == 'tcp':
+            init.pool.request(host, port, frame_id, part, mode, trace.dumps(), head, body)
+        else:
+            data = dict()
+            data['input'] = codec.join(head, body)
+            data['next'] = mode
+            data['id'] = frame_id
+            data['part'] = part
+            data['trace'] = trace.dumps()
+            init.pool.request(host, port, 'forward', data)
+    finally:
+        if region is not None:
+            init.ring.free(region)
+        queue.put(addr)
+    end = time.time()
+    init.add('sent')
+
+    init.node_timer(mode, end - start)
+
+
+def wait_ready(timeout, interval=0.5):
+    """
+        Wait until every device in the topology has built and warmed up the
+        models of its layers, so the first frames do not pay for it. A device
+        that can not be reached yet is asked again.
+
+        Args:
+            timeout: Seconds to wait at most.
+            interval: Seconds between rounds of asking devices.
+
+        Returns:
+            List of addresses of devices not ready in time.
+    """
+    init = Initializer.create_init()
+    waiting = sorted(set(split(addr, 12345) for name in init.topology.stages
+                         for addr in init.topology.replicas.get(name, [])))
+    print 'waiting for {:d} devices to be ready'.format(len(waiting))
+    start = time.time()
+    while True:
+        for host, port in list(waiting):
+            try:
+                if init.pool.ready(host, port):
+                    waiting.remove((host, port))
+            except CONNECTION_ERRORS:
+                pass
+        if len(waiting) == 0 or time.time() - start > timeout:
+            break
+        time.sleep(interval)
+    if len(waiting) == 0:
+        print 'all devices ready in {:.3f} sec'.format(time.time() - start)
+    return ['{:s}:{:d}'.format(host, port) for host, port in waiting]
+
+
+def sender(tasks):
+    """ Executor handler, send queued (X, mode, frame_id, trace, part) frames. """
+    for args in tasks:
+        send_request(*args)
+
+
+def master():
+    """
+        Master function for real time model inference. A basic while loop
+        gets one frame at each time. It queues the frame for sender threads,
+        when the queue is full the frame is handled by overflow policy, so a
+        slow pipeline does not pile up threads. The time between frames is set
+        by rate controller from the results got back.
+    """
+    init = Initializer.create_init()
+    first = init.topology.first
+    # ids of a run start from a random nonce in the high 32 bits, so a node does
+    # not take frames of a restarted initial for ones its join tables expired.
+    frame_id = random.getrandbits(31) << 32
+    while True:
+        # current frame in input shape of first layer
+        ret, frame = 'unknown', np.random.rand(*first.shape) * 255
+        frame = frame.astype(dtype=first.dtype)
+        frame_id += 1
+        trace = tracing.Trace(frame_id)
+        # a captured frame needs no decoding.
+        trace.begin('initial')
+        trace.mark('decode')
+        init.add('produced')
+        if init.tiling is None:
+            init.executor.submit(frame, first.name, frame_id, trace)
+        else:
+            # each strip with its halo rows goes to a device of first layer.
+            for part, (top, bottom) in enumerate(init.tiling.inputs):
+                init.executor.submit(frame[top:bottom], first.name, frame_id, trace.copy(), part)
+        message = init.controller.update(init.executor.dropped)
+        if message is not None:
+            print message
+        time.sleep(init.controller.interval())
+
+
+class Responder(ipc.Responder):
+    def __init__(self):
+        ipc.Responder.__init__(self, PROTOCOL)
+
+    def invoke(self, msg, req):
+        """
+            This functino is invoked by do_POST to handle the request. Invoke handles
+            the request and get response for the request. This is the key of each node.
+            All models forwarding and output redirect are done here. Because the invoke
+            method of initializer only needs to receive the data packet, it does not do
+            anything in the function and return None.
+
+            Args:
+                msg: Meta data.
+                req: Contains data packet.
+
+            Returns:
+                None
+
+            Raises:
+                AvroException: if the data does not have correct syntac defined in Schema
+        """
+        if msg.name == 'forward':
+            init = Initializer.create_init()
+            try:
+                init.add('completed')
+                init.controller.complete(req['id'])
+                init.trace.add(tracing.Trace.loads(req['trace']))
+                init.timer()
+                return
+            except Exception, e:
+                print 'Error', e.message
+        elif msg.name == 'ping':
+            return time.time()
+        else:
+            raise schema.AvroException('unexpected message:', msg.getname())
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection alive, so senders can reuse it for next frame.
+    protocol_version = 'HTTP/1.1'
+    # close idle keep-alive connection after this many seconds.
+    timeout = 60
+
+    def do_POST(self):
+        """
+            Handle request from other devices.
+            do_POST is automatically called by ThreadedHTTPServer. It creates a new
+            responder for each request. The responder generates response and write
+            response to data sent back. The response is framed in memory first so
+            Content-Length can be set for keep-alive connection.
+        """
+        self.responder = Responder()
+        call_request_reader = ipc.FramedReader(self.rfile)
+        call_request = call_request_reader.read_framed_message()
+        resp_body = self.responder.respond(call_request)
+        resp_writer = ipc.FramedWriter(StringIO())
+        resp_writer.write_framed_message(resp_body)
+        resp_data = resp_writer.writer.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'avro/binary')
+        self.send_header('Content-Length', str(len(resp_data)))
+        self.end_headers()
+        self.wfile.write(resp_data)
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """ Handle requests in separate thread. """
+    # keep-alive handler threads should not keep the process running.
+    daemon_threads = True
+
+
+def receive(frame_id, part, name, record, buf, size):
+    """ Callback of raw TCP server, the last layer output arrives here. """
+    init = Initializer.create_init()
+    init.add('completed')
+    init.controller.complete(frame_id)
+    init.trace.add(tracing.Trace.loads(record))
+    init.timer()
+
+
+def main(cmd):
+    init = Initializer.create_init()
+    init.transport = cmd.transport
+    if init.transport == 'tcp':
+        init.pool = ConnectionPool(wire.TensorConnection)
+    if cmd.shm:
+        init.ring = shm.Ring()
+    # read stages and ip resources from config files
+    init.topology = topology.load()
+    first = init.topology.first
+    init.codec = init.topology.codec.get(first.name, 'raw')
+    if first.tiles > 1:
+        # model layers are only needed for the rows of each strip.
+        import model as ml
+        import tiling
+        init.tiling = tiling.Tiling.build(first.builder(ml), first.shape[0], first.tiles)
+    devices = 0
+    for addr in init.topology.replicas[first.name]:
+        init.queue.put(addr)
+        devices += 1
+    # one sender per first layer device by default.
+    init.executor = stage.StageExecutor(sender, cmd.pending, cmd.senders or devices,
+                                        policy=cmd.overflow)
+    init.controller = rate.RateController(cmd.rate, high=cmd.max_rate, target=cmd.target_latency)
+    if cmd.fixed_rate:
+        init.controller.low = init.controller.high = cmd.rate
+    init.trace = tracing.TraceStat(cmd.trace)
+    if cmd.ping > 0:
+        clock.start(init.pool, init.clock, cmd.ping, not cmd.quiet)
+
+    # listen on port 9999 for model inference result
+    if init.transport == 'tcp':
+        server = wire.TensorServer(('0.0.0.0', cmd.port), receive)
+    else:
+        server = ThreadedHTTPServer(('0.0.0.0', cmd.port), Handler)
+        server.allow_reuse_address = True
+    Thread(target=server.serve_forever, args=()).start()
+
+    if cmd.ready_timeout > 0:
+        late = wait_ready(cmd.ready_timeout)
+        if len(late) > 0:
+            print 'not ready after {:.0f} sec, start anyway: {:s}'.format(cmd.ready_timeout, ', '.join(late))
+    master()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--transport', choices=['avro', 'tcp'], default='avro',
+                        help='transport between devices, Avro RPC or raw TCP tensor frame')
+    parser.add_argument('-p', '--port', type=int, default=9999,
+                        help='port to listen on, set it with host:port in IP table')
+    parser.add_argument('--no-shm', dest='shm', action='store_false', default=True,
+                        help='do not use shared memory for devices on the same host')
+    parser.add_argument('-s', '--senders', type=int, default=0,
+                        help='number of sender threads, default to one per first layer device')
+    parser.add_argument('--pending', type=int, default=4,
+                        help='number of frames waiting for a sender')
+    parser.add_argument('--overflow', choices=stage.POLICIES, default='drop-oldest',
+                        help='what to do with a new frame when pending frames are full')
+    parser.add_argument('-r', '--rate', type=float, default=33.3,
+                        help='frames per second to start with')
+    parser.add_argument('--max-rate', type=float, default=100.0,
+                        help='highest frames per second the rate controller goes up to')
+    parser.add_argument('--target-latency', type=float, default=0.0,
+                        help='seconds of latency the rate controller keeps under, default '
+                             'to 1.5 times the lowest latency seen')
+    parser.add_argument('--fixed-rate', action='store_true', default=False,
+                        help='send frames at fixed rate without rate controller')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write spans of every frame to Chrome trace JSON file')
+    parser.add_argument('--ping', type=float, default=5.0,
+                        help='seconds between clock pings to first layer devices, 0 to turn off')
+    parser.add_argument('--quiet', action='store_true', default=False,
+                        help='do not print clock table of each ping round')
+    parser.add_argument('--ready-timeout', type=float, default=600.0,
+                        help='seconds to wait for all devices to warm up before streaming, 0 to not wait')
+    parser.set_defaults(**topology.defaults())
+    cmd = parser.parse_args()
+    main(cmd)
@@ -0,0 +1,87 @@
+"""
+    This module joins the partial outputs of a layer running on several
+    devices. Every packet carries the id of its frame and the index of the
+    partition it holds, so the merge layer only concatenates partitions of the
+    same frame, in partition order, whatever order they arrive in. A frame that
+    does not get all partitions in time is expired and counted as dropped.
+"""
+import time
+from collections import deque
+from threading import Lock
+
+
+class JoinTable(object):
+    """
+        Partitions waiting for the rest of their frame.
+
+        Attributes:
+            parts: Number of partitions of a frame.
+            timeout: Seconds a frame waits for missing partitions.
+            table: A dictionary maps frame id to arrival time of its first partition
+                    and a dictionary maps partition index to partition.
+            expired: Ids of recently expired frames, a partition arriving late for
+                    them is dropped instead of waiting again. Initial starts the ids
+                    of every run from a random nonce, so frames of a restarted
+                    initial do not match them.
+            joined: Number of complete frames.
+            dropped: Number of expired frames.
+            late: Number of partitions arriving after their frame expired.
+            duplicate: Number of partitions received twice.
+            lock: Threading lock for table and counters.
+    """
+
+    def __init__(self, parts=2, timeout=1.0):
+        self.parts = parts
+        self.timeout = timeout
+        self.table = dict()
+        self.expired = deque(maxlen=1024)
+        self.joined = 0
+        self.dropped = 0
+        self.late = 0
+        self.duplicate = 0
+        self.lock = Lock()
+
+    def add(self, frame_id, part, value):
+        """
+            Store a partition.
+
+            Args:
+                frame_id: Id of frame.
+                part: Partition index.
+                value: Partition array, or a tuple holding it with its metadata. It
+                        is kept, so it must not be a view of a buffer reused by the
+                        receiver.
+
+            Returns:
+                List of all partitions of the frame in partition order once it is
+                complete, otherwise None.
+        """
+        with self.lock:
+            self.expire()
+            if frame_id in self.expired:
+                self.late += 1
+                return None
+            _, partitions = self.table.setdefault(frame_id, (time.time(), dict()))
+            if part in partitions:
+                self.duplicate += 1
+            partitions[part] = value
+            if len(partitions) < self.parts:
+                return None
+            del self.table[frame_id]
+            self.joined += 1
+            return [partitions[k] for k in sorted(partitions)]
+
+    def expire(self):
+        """ Drop frames waiting longer than timeout, called with lock held. """
+        now = time.time()
+        for frame_id in [k for k, (arrival, _) in self.table.items() if now - arrival > self.timeout]:
+            del self.table[frame_id]
+            self.expired.append(frame_id)
+            self.dropped += 1
+
+    def report(self):
+        with self.lock:
+            total = self.joined + self.dropped
+            return 'joined: {:d}, dropped: {:d} ({:.1%}), late: {:d}, duplicate: {:d}, waiting: {:d}'.format(
+                self.joined, self.dropped, self.dropped / float(total) if total > 0 else 0.0,
+                self.late, self.duplicate, len(self.table))
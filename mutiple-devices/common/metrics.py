@@ -0,0 +1,224 @@
+"""
+    This module keeps counters and latency histograms of a node and serves
+    them on a separate HTTP port in Prometheus text format, so monitoring does
+    not depend on printing on the request path.
+
+    Recording takes no lock. An increment or observation is appended to a
+    deque, which is atomic, and pending values are folded into totals when the
+    metric is read, or by a recording thread when many are pending and no other
+    thread is folding.
+
+    Histograms have log-linear buckets like HDR histograms: each power of two
+    is split into 4 buckets, so a bucket bound is within 25% of any value in
+    the bucket, from about 10 microseconds up to a minute.
+"""
+import bisect
+import numbers
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import OrderedDict, deque
+from threading import Thread, Lock
+
+BOUNDS = [2.0 ** exponent * (1 + k / 4.0) for exponent in range(-17, 6) for k in range(4)]
+# pending values folded by a recording thread, so memory stays bounded without scrapes.
+PENDING = 1024
+
+
+class Counter(object):
+    """
+        Counter of events or amounts.
+
+        Attributes:
+            total: Folded total.
+            pending: Increments not folded yet.
+            lock: Threading lock for folding.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.pending = deque()
+        self.lock = Lock()
+
+    def inc(self, value=1):
+        self.pending.append(value)
+        if len(self.pending) > PENDING and self.lock.acquire(False):
+            try:
+                self.fold()
+            finally:
+                self.lock.release()
+
+    def fold(self):
+        """ Add pending increments to total, called with lock held. """
+        while self.pending:
+            self.total += self.pending.popleft()
+
+    def value(self):
+        with self.lock:
+            self.fold()
+            return self.total
+
+
+class Histogram(Counter):
+    """
+        Histogram of durations with log-linear buckets.
+
+        Attributes:
+            counts: Number of values in each bucket, the last one is above all bounds.
+            count: Number of values.
+            total: Sum of values.
+    """
+
+    def __init__(self):
+        Counter.__init__(self)
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.inc((bisect.bisect_left(BOUNDS, value), value))
+
+    def fold(self):
+        while self.pending:
+            index, value = self.pending.popleft()
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def value(self):
+        """ Tuple of bucket counts, number and sum of values. """
+        with self.lock:
+            self.fold()
+            return list(self.counts), self.count, self.total
+
+
+def number(value):
+    """
+        Sample value in Prometheus text format. Integers are written in digits,
+        repr of a long on Python 2 ends with L, which is not a number.
+    """
+    if isinstance(value, numbers.Integral):
+        return '{:d}'.format(int(value))
+    return repr(float(value))
+
+
+def labels(pairs, **extra):
+    """ Prometheus label set of (name, value) pairs. """
+    pairs = list(pairs) + sorted(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join('{:s}="{:s}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in pairs) + '}'
+
+
+class Registry(object):
+    """
+        Metrics of a process by name and labels.
+
+        Attributes:
+            families: An ordered dictionary maps metric name to type, help text and
+                    a dictionary maps label pairs to metric.
+            callbacks: An ordered dictionary maps metric name to type, help text and
+                    function returns list of (labels dictionary, value), for values
+                    read from other objects when scraped.
+            lock: Threading lock for creating metrics.
+    """
+
+    def __init__(self):
+        self.families = OrderedDict()
+        self.callbacks = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, kind, name, text, labels):
+        key = tuple(sorted(labels.items()))
+        family = self.families.get(name)
+        metric = family[2].get(key) if family is not None else None
+        if metric is None:
+            with self.lock:
+                family = self.families.setdefault(name, (kind, text, dict()))
+                metric = family[2].setdefault(key, Histogram() if kind == 'histogram' else Counter())
+        return metric
+
+    def counter(self, name, text, **labels):
+        return self.get('counter', name, text, labels)
+
+    def histogram(self, name, text, **labels):
+        return self.get('histogram', name, text, labels)
+
+    def callback(self, name, kind, text, function):
+        """
+            Register a metric read when scraped.
+
+            Args:
+                name: Metric name.
+                kind: counter or gauge.
+                text: Help text.
+                function: Function returns list of (labels dictionary, value).
+        """
+        with self.lock:
+            self.callbacks[name] = (kind, text, function)
+
+    def render(self):
+        """ All metrics in Prometheus text format. """
+        with self.lock:
+            families = [(name, kind, text, sorted(metrics.items()))
+                        for name, (kind, text, metrics) in self.families.items()]
+            callbacks = list(self.callbacks.items())
+        lines = []
+        for name, kind, text, metrics in families:
+            lines.append('# HELP {:s} {:s}'.format(name, text))
+            lines.append('# TYPE {:s} {:s}'.format(name, kind))
+            for key, metric in metrics:
+                if kind == 'histogram':
+                    counts, count, total = metric.value()
+                    cumulative = 0
+                    for bound, n in zip(BOUNDS, counts):
+                        cumulative += n
+                        lines.append('{:s}_bucket{:s} {:d}'.format(name, labels(key, le=repr(bound)), cumulative))
+                    lines.append('{:s}_bucket{:s} {:d}'.format(name, labels(key, le='+Inf'), count))
+                    lines.append('{:s}_sum{:s} {:s}'.format(name, labels(key), number(total)))
+                    lines.append('{:s}_count{:s} {:d}'.format(name, labels(key), count))
+                else:
+                    lines.append('{:s}{:s} {:s}'.format(name, labels(key), number(metric.value())))
+        for name, (kind, text, function) in callbacks:
+            lines.append('# HELP {:s} {:s}'.format(name, text))
+            lines.append('# TYPE {:s} {:s}'.format(name, kind))
+            for pairs, value in function():
+                lines.append('{:s}{:s} {:s}'.format(name, labels(sorted(pairs.items())), number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Serve metrics of server registry on GET /metrics. """
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Scrapes are not logged. """
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """ Metrics HTTP server, each scrape in separate thread. """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, registry):
+        HTTPServer.__init__(self, address, MetricsHandler)
+        self.registry = registry
+
+
+def serve(registry, port):
+    """ Serve registry on port in a daemon thread. """
+    server = MetricsServer(('0.0.0.0', port), registry)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
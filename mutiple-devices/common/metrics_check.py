@@ -0,0 +1,38 @@
+"""
+    This module checks that metrics render as Prometheus text the collector
+    can parse, for every kind of value a node records: small and long integer
+    counters, float counters, histograms and callback values, long ones
+    included. On 32-bit Python 2 a byte counter becomes a long after 2 GB.
+"""
+import sys
+
+import collector
+import metrics
+
+
+def main():
+    registry = metrics.Registry()
+    registry.counter('check_frames_total', 'Small integer counter.').inc(3)
+    registry.counter('check_bytes_total', 'Counter past sys.maxint.').inc(long(sys.maxint) + 5)
+    registry.counter('check_seconds_total', 'Float counter.').inc(0.25)
+    registry.histogram('check_latency_seconds', 'Histogram.').observe(0.01)
+    registry.callback('check_callback', 'gauge', 'Callback values.',
+                      lambda: [({'kind': 'long'}, long(2 ** 40)), ({'kind': 'float'}, 1.5),
+                               ({'kind': 'bool'}, True)])
+    text = registry.render()
+    samples = collector.parse(text)
+    expect = {('check_frames_total', ()): 3, ('check_bytes_total', ()): sys.maxint + 5,
+              ('check_seconds_total', ()): 0.25, ('check_latency_seconds_count', ()): 1,
+              ('check_callback', (('kind', 'long'),)): 2 ** 40,
+              ('check_callback', (('kind', 'float'),)): 1.5, ('check_callback', (('kind', 'bool'),)): 1}
+    passed = True
+    for key, value in sorted(expect.items()):
+        if samples.get(key) != float(value):
+            print '{:s}{}: {}, expect {}, MISMATCH'.format(key[0], dict(key[1]), samples.get(key), value)
+            passed = False
+    print 'rendered {:d} samples, {:s}'.format(len(samples), 'ok' if passed else 'MISMATCH')
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,797 @@
+"""
+    This module runs the node of any deployment: the stages it serves, the
+    model of each stage and where outputs go are read from the topology file
+    and IP table in resource/ of the working directory, see topology.py.
+"""
+import argparse
+import os
+import sys
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+from functools import partial
+from multiprocessing import Queue
+from threading import Thread, Lock
+import avro.ipc as ipc
+import avro.protocol as protocol
+import avro.schema as schema
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import clock
+import codec
+import dense
+import join
+import metrics
+import shm
+import stage
+import topology
+import tracing
+import weights
+import wire
+from pool import AvroConnection, ConnectionPool, split
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+# read data packet format.
+PROTOCOL = protocol.parse(open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             'resource', 'image.avpr')).read())
+
+
+class Node(object):
+    """
+        Singleton Node class. It will store data if necessary, record next layer
+        response time, send data packet to next layer and store the loaded model
+        in memory without reloading.
+
+        Attributes:
+            ip: A dictionary contains Queue of ip addresses for different models type.
+            model: A dictionary maps layer name to runner of its loaded model.
+            graph: Default graph used by Tensorflow, None until a model is built
+                    on it.
+            debug: Flag for debugging.
+            lock: Threading lock for the tables of models, executors, strips,
+                    slices and joins. It is only held to look up and publish an
+                    entry, never while a model is built or run.
+            building: A dictionary maps (table, layer name) to the lock held while
+                    that entry is built, so other layers go on meanwhile.
+            graph_lock: Threading lock for building models in TensorFlow graphs,
+                    graph construction is not thread safe.
+            total: A dictionary maps next layer name to total time of sending frames.
+            count: A dictionary maps next layer name to number of frames sent.
+            input: A dictionary maps merge layer name to its join table, which holds
+                    the output of each device of previous layer until all partitions
+                    of the same frame arrive.
+            timeout: Seconds a frame waits in join table for missing partitions.
+            topology: Stages of the pipeline with their devices.
+            transport: Transport to next layer devices, avro or raw tcp.
+            codec: A dictionary maps next layer name to codec used on that edge.
+            stats: A dictionary maps next layer name to statistics of that edge.
+            pool: Persistent connections to next layer devices.
+            ring: Shared memory ring buffer for next layer on the same host, None
+                    if shared memory is disabled.
+            clock: Clock offset and round trip time of next layer devices.
+            tilings: A dictionary maps tiled layer name to rows of its strips.
+            port: Port this node listens on.
+            slices: A dictionary maps split layer name to the slice this node runs,
+                    its index among devices of the layer in IP table.
+            executors: A dictionary maps layer name to executor with bounded input
+                    queue and workers running model inference in batches.
+            queue: Size of input queue of each layer, 0 if requests wait for model
+                    inference before they return.
+            workers: Number of worker threads of each layer.
+            batch: Maximum batch size of model inference of a layer that does not
+                    set its own in topology.
+            wait: Seconds to wait for a batch to fill, for a layer that does not
+                    set its own in topology.
+            metrics: Counters and latency histograms served on metrics port.
+            verbose: Flag for printing statistics of each frame sent.
+            weights: Directory of weight store the weights of each layer are read
+                    from, None for random weights.
+            cache: Directory of frozen graph cache, None to build Keras models.
+            engine: Engine running the models, tensorflow, or numpy for dense
+                    layers from weight store without importing TensorFlow.
+            int8: Flag for int8 dense kernels with numpy engine.
+            ready: Flag set once models of the layers of this node are built and
+                    warmed up, senders wait for it before streaming.
+    """
+
+    instance = None
+
+    def __init__(self):
+        self.ip = dict()
+        self.model = dict()
+        self.graph = None
+        self.debug = False
+        self.lock = Lock()
+        self.building = dict()
+        self.graph_lock = Lock()
+        self.total = dict()
+        self.count = dict()
+        self.input = dict()
+        self.timeout = 1.0
+        self.topology = None
+        self.transport = 'avro'
+        self.codec = dict()
+        self.stats = dict()
+        self.pool = ConnectionPool(partial(AvroConnection, PROTOCOL))
+        self.ring = None
+        self.clock = clock.ClockTable()
+        self.tilings = dict()
+        self.port = 12345
+        self.slices = dict()
+        self.executors = dict()
+        self.queue = 0
+        self.workers = 1
+        self.batch = 1
+        self.wait = 0.0
+        self.metrics = metrics.Registry()
+        self.verbose = True
+        self.weights = None
+        self.cache = None
+        self.engine = 'tensorflow'
+        self.int8 = False
+        self.ready = False
+
+    def log(self, step, data=''):
+        """
+            Log function for debug. Turn the flag on to show each step result.
+
+            Args:
+                step: Each step names.
+                data: Data format or size.
+        """
+        if self.debug:
+            print '++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'
+            for k in range(0, len(step), 68):
+                print '+{:^68.68}+'.format(step[k:k + 68])
+            for k in range(0, len(data), 68):
+                print '+{:^68.68}+'.format(data[k:k + 68])
+            print '++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'
+            print
+
+    def once(self, table, name, build):
+        """
+            Entry of a table, built by the first thread asking for it while later
+            ones wait for it. Only the entry has a lock during the build.
+
+            Args:
+                table: Dictionary of the node, such as model or tilings.
+                name: Layer name.
+                build: Function builds the entry.
+        """
+        with self.lock:
+            if name in table:
+                return table[name]
+            lock = self.building.setdefault((id(table), name), Lock())
+        with lock:
+            with self.lock:
+                if name in table:
+                    return table[name]
+            value = build()
+            with self.lock:
+                table[name] = value
+            return value
+
+    def load(self, name, builder):
+        """
+            Model of a layer, it is built once on first use and shared by workers.
+            On TensorFlow it is built in the graph of the node and runs through
+            a session callable, not Keras predict.
+
+            Args:
+                name: Model name of the layer.
+                builder: Function builds the model.
+
+            Returns:
+                Runner of the model, or the model of numpy engine.
+        """
+        def build():
+            if self.engine == 'numpy':
+                return builder()
+            # TensorFlow is only imported by nodes running models on it.
+            import tensorflow as tf
+            import runner
+            with self.graph_lock:
+                if self.graph is None:
+                    self.graph = tf.get_default_graph()
+                with self.graph.as_default():
+                    return runner.Runner(builder())
+        return self.once(self.model, name, build)
+
+    def build(self, name):
+        """
+            Model of a layer from topology, with any number of input rows for a
+            tiled layer and the slice of this node for a split layer. Weights are
+            mapped from weight store if there is one. With a cache directory the
+            model is a frozen graph, built once and loaded on later starts. With
+            numpy engine the model is read from weight store instead.
+        """
+        stage = self.topology.stages[name]
+        part = self.slice(name) if stage.split else 0
+        if self.engine == 'numpy':
+            return self.load(name, partial(dense.load, self.weights, stage, part, self.int8))
+        import frozen
+        import model as ml
+        import tiling
+        if self.weights is not None:
+            builder = weights.builder(self.weights, stage, ml, part)
+        else:
+            builder = stage.builder(ml, part)
+        if stage.tiles > 1:
+            build = lambda: tiling.flexible(builder())
+        else:
+            build = builder
+        if self.cache is not None:
+            build = partial(frozen.load, self.cache, name + ('.{:d}'.format(part) if stage.split else ''),
+                            frozen.key(stage, part, ml, self.weights), build)
+        return self.load(name, build)
+
+    def warm(self, names, runs):
+        """
+            Build model and executor of the layers this node serves and run each
+            model on zero inputs of every input shape and batch size, so graph
+            building and setup of the first run are not paid by the first frame.
+            The node reports ready afterwards.
+
+            Args:
+                names: Layer names.
+                runs: Number of warm-up runs of each input shape and batch size.
+        """
+        start = time.time()
+        for name in names:
+            stage = self.topology.stages[name]
+            self.executor(name)
+            if stage.tiles > 1:
+                shapes = set((last - first,) + stage.shape[1:] for first, last in self.tiling(name).inputs)
+            else:
+                shapes = set([stage.shape])
+            model = self.build(name)
+            for shape in sorted(shapes):
+                for size in sorted(set([1, self.batching(name)[0]])):
+                    X = np.zeros((size,) + shape, dtype=stage.dtype)
+                    for _ in range(runs):
+                        model.predict(X)
+        self.ready = True
+        print 'ready: {:s} in {:.3f} sec'.format(', '.join(names) or 'no layer', time.time() - start)
+
+    def batching(self, name):
+        """ Largest batch of a layer and seconds to wait for it, from topology or node defaults. """
+        stage = self.topology.stages[name]
+        return (self.batch if stage.batch is None else stage.batch,
+                self.wait if stage.wait is None else stage.wait)
+
+    def executor(self, name):
+        """ Executor of a layer, it is created with its workers on first frame. """
+        if name not in self.topology.stages:
+            raise ValueError('unknown layer {}'.format(name))
+        with self.lock:
+            if name not in self.executors:
+                batch, wait = self.batching(name)
+                self.executors[name] = stage.StageExecutor(partial(Responder().run, name),
+                                                           max(self.queue, batch), self.workers,
+                                                           batch, wait)
+            return self.executors[name]
+
+    def tiling(self, name):
+        """ Strips of a tiled layer, a layer sending to it cuts its output the same way. """
+        def build():
+            import model as ml
+            import tiling
+            stage = self.topology.stages[name]
+            with self.graph_lock:
+                return tiling.Tiling.build(stage.builder(ml), stage.shape[0], stage.tiles)
+        return self.once(self.tilings, name, build)
+
+    def addresses(self, name):
+        """ Indices of the addresses of a layer in IP table that are this node. """
+        return [k for k, (host, port) in
+                enumerate(split(addr, 12345) for addr in self.topology.replicas.get(name, []))
+                if port == self.port and shm.local(host)]
+
+    def roles(self):
+        """ Layers with an address of this node in IP table, in pipeline order. """
+        return [name for name in self.topology.stages if len(self.addresses(name)) > 0]
+
+    def slice(self, name):
+        """
+            Slice of a split layer this node runs. Devices of the layer hold
+            different weights, so this node finds its own address in IP table.
+
+            Raises:
+                ValueError: if not exactly one address of the layer is this node.
+        """
+        with self.lock:
+            if name not in self.slices:
+                index = self.addresses(name)
+                if len(index) != 1:
+                    raise ValueError('{} addresses of split layer {} are this node'.format(len(index), name))
+                self.slices[name] = index[0]
+            return self.slices[name]
+
+    def table(self, name):
+        """ Join table of a merge layer, it is created on first partition. """
+        with self.lock:
+            if name not in self.input:
+                self.input[name] = join.JoinTable(self.topology.stages[name].merge, self.timeout)
+            return self.input[name]
+
+    def timer(self, name, interval):
+        """
+            Print out round trip time of sending to next layer.
+
+            Args:
+                name: Next layer name.
+                interval: A float for time lapse.
+        """
+        with self.lock:
+            self.total[name] = self.total.get(name, 0.0) + interval
+            self.count[name] = self.count.get(name, 0) + 1
+            mean = self.total[name] / self.count[name]
+        if not self.verbose:
+            return
+        print '{:s}: {:.3f}, {:s}, {:s}'.format(name, mean, self.pool.report(), self.stats[name].report())
+        for stage_name, executor in self.executors.items():
+            if executor.batch > 1:
+                print '{:s}: {:s}'.format(stage_name, executor.stat.report())
+        for stage_name, table in self.input.items():
+            if table.joined + table.dropped > 0:
+                print '{:s}: {:s}'.format(stage_name, table.report())
+
+    def received(self, name, trace, size):
+        """ Record an input of a layer once it is decoded. """
+        hop = trace.hops[-1]
+        self.metrics.counter('node_received_total', 'Inputs received by layer.', stage=name).inc()
+        self.metrics.counter('node_received_bytes_total', 'Bytes of inputs received by layer.',
+                             stage=name).inc(size)
+        self.metrics.histogram('node_decode_seconds', 'Time to decode an input.',
+                               stage=name).observe(hop['decode'] - hop['receive'])
+
+    def predicted(self, name, traces):
+        """ Record a batch of a layer once model inference is done. """
+        for trace in traces:
+            hop = trace.hops[-1]
+            self.metrics.histogram('node_queue_seconds', 'Time an input waits for a worker.',
+                                   stage=name).observe(hop['start'] - hop['decode'])
+        hop = traces[0].hops[-1]
+        self.metrics.histogram('node_predict_seconds', 'Time of model inference of a batch.',
+                               stage=name).observe(hop['predict'] - hop['start'])
+
+    def sent(self, name, trace, size, interval):
+        """ Record an output sent to next layer. """
+        hop = trace.hops[-1]
+        self.metrics.counter('node_sent_total', 'Outputs sent to next layer.', next=name).inc()
+        self.metrics.counter('node_sent_bytes_total', 'Bytes of encoded outputs sent to next layer.',
+                             next=name).inc(size)
+        self.metrics.histogram('node_encode_seconds', 'Time to encode an output.',
+                               next=name).observe(hop['encode'] - hop['predict'])
+        self.metrics.histogram('node_send_seconds', 'Round trip time of sending an output.',
+                               next=name).observe(interval)
+
+    def stages(self, read):
+        """ Value read from executor of each layer, for metrics read when scraped. """
+        return [({'stage': name}, read(executor)) for name, executor in sorted(self.executors.items())]
+
+    def dropped(self):
+        """ Number of frames dropped for each reason, read when metrics are scraped. """
+        tables = self.input.values()
+        return [({'reason': 'join-timeout'}, sum(table.dropped for table in tables)),
+                ({'reason': 'late'}, sum(table.late for table in tables)),
+                ({'reason': 'overflow'}, sum(executor.dropped for executor in self.executors.values()))]
+
+    @classmethod
+    def create(cls):
+        if cls.instance is None:
+            cls.instance = cls()
+        return cls.instance
+
+
+class Responder(ipc.Responder):
+    """ Responder called by handler when got request. """
+
+    def __init__(self):
+        ipc.Responder.__init__(self, PROTOCOL)
+
+    def invoke(self, msg, req):
+        """
+            This functino is invoked by do_POST to handle the request. Invoke handles
+            the request and get response for the request. This is the key of each node.
+            All models forwarding and output redirect are done here. Because the invoke
+            method of initializer only needs to receive the data packet, it does not do
+            anything in the function and return None.
+
+            Because this is a node class, it handles the input of any layer in the
+            topology file. Basically the logic is load model as the previous layer
+            request and run model inference. And it will send the current layer output
+            to next layer. In order to avoid long waiting time of model reloading, we
+            make sure each node is assigned to a unique job each time, so it does not
+            need to reload the model.
+
+            Args:
+                msg: Meta data.
+                req: Contains data packet.
+
+            Returns:
+                None: It just acts as confirmation for sender.
+
+            Raises:
+                AvroException: if the data does not have correct syntac defined in Schema
+        """
+        if msg.name == 'forward':
+            trace = tracing.Trace.loads(req['trace'])
+            trace.begin(req['next'], req['part'])
+            X = codec.decode(req['input'])
+            trace.mark('decode')
+            Node.create().received(req['next'], trace, len(req['input']))
+            self.accept(req['next'], X, (req['id'], req['part']), trace)
+        elif msg.name == 'ping':
+            return time.time()
+        elif msg.name == 'ready':
+            return Node.create().ready
+        else:
+            raise schema.AvroException('unexpected message:', msg.getname())
+
+    def accept(self, name, X, frame, trace):
+        """
+            Run the layer for a decoded input in executor of the layer. With an
+            input queue the input is only queued, so the sender gets its response
+            without waiting for model inference. The input may be a view of receive
+            buffer or shared memory, so a copy is queued. Without input queue the
+            request waits for the worker, so the input stays valid.
+
+            Args:
+                name: Model name of this layer.
+                X: Input numpy array.
+                frame: Tuple of frame id and partition index of the input.
+                trace: Trace record of the frame.
+        """
+        node = Node.create()
+        if node.queue == 0:
+            node.executor(name).call(X, frame, trace)
+        else:
+            node.executor(name).submit(np.array(X), frame, trace)
+
+    def run(self, name, tasks):
+        """ Executor handler, run a batch of queued (X, frame, trace) tasks of a layer. """
+        self.forward(name, [task[0] for task in tasks], [task[1] for task in tasks],
+                     [task[2] for task in tasks])
+
+    def forward(self, name, inputs, frames, traces):
+        """
+            Run model inference for the layer and send output to next layer. It is
+            called by executor of the layer and shared by Avro and raw TCP transport,
+            the input is already decoded by the codec and shape carried in packet
+            header. Inputs of several frames are run as one batch and each output
+            is sent with the id of its frame. The layer, its model, next layer and
+            how many devices it fans out to or merges from are read from topology.
+            A fan-out sends a copy to each device of next layer with a partition
+            index, and the merge layer joins partitions of the same frame. For a
+            tiled next layer, the output is cut into strips with halo rows instead.
+            A split next layer gets the output on each of its devices, and a split
+            layer sends its slice with the slice index as partition index.
+
+            Args:
+                name: Model name of this layer.
+                inputs: List of input numpy arrays.
+                frames: List of tuples of frame id and partition index of the inputs.
+                traces: List of trace records of the inputs.
+        """
+        node = Node.create()
+        stage = node.topology.stages[name]
+        tracing.mark(traces, 'start')
+        node.log('{:s} gets data'.format(name))
+        if stage.merge > 1:
+            inputs, frames, traces = self.join(name, inputs, frames, traces)
+            # if no frame is complete, wait for their other partitions.
+            if len(inputs) == 0:
+                return
+        if stage.tiles > 1:
+            output = self.strips(name, inputs, frames)
+        else:
+            for X in inputs:
+                if X.shape != stage.shape:
+                    raise ValueError('{} expects input shape {}, got {}'.format(name, stage.shape, X.shape))
+            model = node.build(name)
+            # the input array of the worker is reused, outputs are new as send threads keep them.
+            batch = model.inputs(len(inputs))
+            for k, X in enumerate(inputs):
+                batch[k] = X
+            output = model.predict(batch)
+        tracing.mark(traces, 'predict')
+        node.log('finish {:s} forward'.format(name))
+        following = node.topology.stages.get(stage.next)
+        for Y, (frame_id, part), trace in zip(output, frames, traces):
+            if stage.split is not None:
+                part = node.slice(name)
+            if stage.fanout > 1:
+                for part in range(stage.fanout):
+                    Thread(target=self.send, args=(Y, stage.next, (frame_id, part), trace.copy())).start()
+            elif following is not None and following.tiles > 1:
+                for part, (first, last) in enumerate(node.tiling(stage.next).inputs):
+                    Thread(target=self.send, args=(Y[first:last], stage.next, (frame_id, part), trace.copy())).start()
+            elif following is not None and following.split is not None:
+                for address in node.topology.replicas[stage.next]:
+                    Thread(target=self.send, args=(Y, stage.next, (frame_id, part), trace.copy(), address)).start()
+            else:
+                Thread(target=self.send, args=(Y, stage.next, (frame_id, part), trace)).start()
+        node.predicted(name, traces)
+
+    def strips(self, name, inputs, frames):
+        """
+            Run model of a tiled layer on strips and keep the output rows each
+            strip owns. Strips differ in height, so each strip index runs as a
+            batch of its own.
+
+            Returns:
+                List of output rows of each strip.
+        """
+        node = Node.create()
+        layout = node.tiling(name)
+        output = [None] * len(inputs)
+        model = node.build(name)
+        for part in sorted(set(part for _, part in frames)):
+            index = [k for k, (_, p) in enumerate(frames) if p == part]
+            first, last = layout.outputs[part]
+            for k, Y in zip(index, model.predict(np.array([inputs[k] for k in index]))):
+                output[k] = Y[first:last]
+        return output
+
+    def join(self, name, inputs, frames, traces):
+        """
+            Join partitions of the same frame for a merge layer.
+
+            Returns:
+                Tuple of lists of inputs, frames and traces of complete frames. An
+                input is the partitions concatenated in partition order, along rows
+                for strips of a tiled layer, or their sum after a layer split with sum.
+        """
+        node = Node.create()
+        table = node.table(name)
+        stage = node.topology.stages[name]
+        batch, batch_frames, batch_traces = [], [], []
+        for X, (frame_id, part), trace in zip(inputs, frames, traces):
+            # raw tcp input is a view of receive buffer, so keep a copy.
+            parts = table.add(frame_id, part, (X.copy(), trace))
+            node.log('join', table.report())
+            if parts is None:
+                continue
+            if stage.reduce == 'sum':
+                batch.append(np.sum([Y for Y, _ in parts], axis=0))
+            else:
+                batch.append(np.concatenate([Y for Y, _ in parts], axis=stage.axis))
+            batch_frames.append((frame_id, 0))
+            # the partition arriving last is on the critical path of the frame.
+            trace = max([t for _, t in parts], key=lambda t: t.hops[-1]['receive'])
+            trace.hops[-1]['part'] = 0
+            batch_traces.append(trace)
+        return batch, batch_frames, batch_traces
+
+    def send(self, X, name, frame, trace, address=None):
+        """
+            Send data to other devices. The data packet contains data and models name.
+            Ip address of next device pop from Queue of a ip list, unless the device
+            is given. Partitions of a frame have to meet on the same device of a
+            merge layer, so its device is picked by frame id. Data is encoded
+            with the codec configured for the edge to next layer. If next device is
+            on the same host, data goes through shared memory and only a pointer
+            is sent.
+
+            Args:
+                 X: numpy array
+                 name: next device models name
+                 frame: tuple of frame id and partition index
+                 trace: trace record of the frame, this layer stamps encode and send
+                 address: address of next device, None to pick one
+        """
+        node = Node.create()
+
+        # sparse codec is picked when the output after ReLU has enough zeros.
+        zeros = codec.sparsity(X)
+        head, body = codec.encode(X, codec.choose(node.codec.get(name, 'raw'), zeros))
+        node.stats.setdefault(name, codec.EdgeStat()).add(X, zeros, head, body)
+        trace.mark('encode')
+        size = len(head) + len(body)
+
+        queue = None
+        following = node.topology.stages.get(name)
+        if address is None and following is not None and following.merge > 1:
+            replicas = node.topology.replicas[name]
+            address = replicas[frame[0] % len(replicas)]
+        if address is None:
+            queue = node.ip[name]
+            address = queue.get()
+
+        # initializer use port 9999 to receive data
+        host, port = split(address, 9999 if name == 'initial' else 12345)
+        node.clock.watch((host, port))
+        trace.hops[-1]['offset'] = node.clock.offset((host, port))
+        region = None
+        if node.ring is not None and shm.local(host):
+            region, size = node.ring.write(head, body)
+            head, body = codec.pointer(node.ring.path, region, size), b''
+        trace.mark('send')
+        start = time.time()
+        try:
+            if node.transport == 'tcp':
+                node.pool.request(host, port, frame[0], frame[1], name, trace.dumps(), head, body)
+            else:
+                data = dict()
+                data['input'] = codec.join(head, body)
+                data['next'] = name
+                data['id'], data['part'] = frame
+                data['trace'] = trace.dumps()
+                node.log('finish assembly')
+                node.pool.request(host, port, 'forward', data)
+        finally:
+            if region is not None:
+                node.ring.free(region)
+            if queue is not None:
+                queue.put(address)
+        end = time.time()
+        node.sent(name, trace, size, end - start)
+        node.timer(name, end - start)
+
+        node.log('node gets request back')
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection alive, so senders can reuse it for next frame.
+    protocol_version = 'HTTP/1.1'
+    # close idle keep-alive connection after this many seconds.
+    timeout = 60
+
+    def do_POST(self):
+        """
+            do_POST is automatically called by ThreadedHTTPServer. It creates a new
+            responder for each request. The responder generates response and write
+            response to data sent back. The response is framed in memory first so
+            Content-Length can be set for keep-alive connection.
+        """
+        self.responder = Responder()
+        call_request_reader = ipc.FramedReader(self.rfile)
+        call_request = call_request_reader.read_framed_message()
+        resp_body = self.responder.respond(call_request)
+        resp_writer = ipc.FramedWriter(StringIO())
+        resp_writer.write_framed_message(resp_body)
+        resp_data = resp_writer.writer.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'avro/binary')
+        self.send_header('Content-Length', str(len(resp_data)))
+        self.end_headers()
+        self.wfile.write(resp_data)
+
+    def finish(self):
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        finally:
+            shm.release()
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """ Handle requests in separate thread. """
+    # keep-alive handler threads should not keep the process running.
+    daemon_threads = True
+
+
+def receive(frame_id, part, name, record, buf, size):
+    """ Callback of raw TCP server, frames go through the same forward as Avro. """
+    trace = tracing.Trace.loads(record)
+    trace.begin(name, part)
+    X = codec.decode(buf, 0, size)
+    trace.mark('decode')
+    Node.create().received(name, trace, size)
+    Responder().accept(name, X, (frame_id, part), trace)
+
+
+def main(cmd):
+    node = Node.create()
+
+    node.debug = cmd.debug
+    node.transport = cmd.transport
+    if node.transport == 'tcp':
+        node.pool = ConnectionPool(wire.TensorConnection)
+    if cmd.shm:
+        node.ring = shm.Ring()
+    node.timeout = cmd.join_timeout
+    node.queue = cmd.queue
+    node.workers = cmd.workers
+    node.batch = cmd.batch
+    node.wait = cmd.wait / 1000.0
+    node.verbose = not cmd.quiet
+    node.port = cmd.port
+    node.weights = cmd.weights
+    node.cache = cmd.cache
+    node.engine = cmd.engine
+    node.int8 = cmd.int8
+    if node.engine == 'numpy' and node.weights is None:
+        raise ValueError('numpy engine reads models from weight store, set --weights')
+    if node.int8 and node.engine != 'numpy':
+        raise ValueError('int8 weights need numpy engine')
+
+    # read stages and ip resources from config files
+    node.topology = topology.load()
+    node.codec = node.topology.codec
+    for name, addresses in node.topology.replicas.items():
+        node.ip[name] = Queue()
+        for addr in addresses:
+            node.ip[name].put(addr)
+
+    if cmd.ping > 0:
+        clock.start(node.pool, node.clock, cmd.ping, node.verbose)
+
+    node.metrics.callback('node_queue_depth', 'gauge', 'Inputs waiting in queue of layer.',
+                          partial(node.stages, stage.StageExecutor.depth))
+    node.metrics.callback('node_workers', 'gauge', 'Worker threads of layer.',
+                          partial(node.stages, lambda executor: len(executor.threads)))
+    node.metrics.callback('node_processed_total', 'counter', 'Inputs run by workers of layer.',
+                          partial(node.stages, lambda executor: executor.stat.totals()[0]))
+    node.metrics.callback('node_busy_seconds_total', 'counter', 'Time workers of layer spend running batches.',
+                          partial(node.stages, lambda executor: executor.stat.totals()[1]))
+    node.metrics.callback('node_dropped_total', 'counter', 'Frames dropped by reason.', node.dropped)
+    metrics_port = cmd.port + 1000 if cmd.metrics_port is None else cmd.metrics_port
+    if metrics_port > 0:
+        metrics.serve(node.metrics, metrics_port)
+
+    # layers are warmed up while the server answers that the node is not ready yet.
+    roles = cmd.stage or node.roles()
+    for name in roles:
+        if name not in node.topology.stages:
+            raise ValueError('unknown layer {}'.format(name))
+    Thread(target=node.warm, args=(roles, cmd.warmup)).start()
+
+    if node.transport == 'tcp':
+        server = wire.TensorServer(('0.0.0.0', cmd.port), receive, lambda: node.ready)
+    else:
+        server = ThreadedHTTPServer(('0.0.0.0', cmd.port), Handler)
+        server.allow_reuse_address = True
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--debug', action='store_true', default=False,
+                        help='set to debug mode')
+    parser.add_argument('-t', '--transport', choices=['avro', 'tcp'], default='avro',
+                        help='transport between devices, Avro RPC or raw TCP tensor frame')
+    parser.add_argument('-p', '--port', type=int, default=12345,
+                        help='port to listen on, set it with host:port in IP table')
+    parser.add_argument('--no-shm', dest='shm', action='store_false', default=True,
+                        help='do not use shared memory for devices on the same host')
+    parser.add_argument('-q', '--queue', type=int, default=0,
+                        help='acknowledge requests once queued, with queue of this size')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of threads running model inference from queue')
+    parser.add_argument('-b', '--batch', type=int, default=1,
+                        help='run model inference for up to this many queued frames at once, '
+                             'for layers without batch in topology')
+    parser.add_argument('--wait', type=float, default=10,
+                        help='milliseconds to wait for more frames to fill a batch, '
+                             'for layers without wait in topology')
+    parser.add_argument('--join-timeout', type=float, default=1.0,
+                        help='seconds a frame waits for outputs of all previous layer devices')
+    parser.add_argument('--ping', type=float, default=5.0,
+                        help='seconds between clock pings to next layer devices, 0 to turn off')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='port of Prometheus metrics endpoint, port + 1000 by default, 0 to turn off')
+    parser.add_argument('--quiet', action='store_true', default=False,
+                        help='do not print statistics of each frame sent and clock table of each ping round')
+    parser.add_argument('-s', '--stage', nargs='+',
+                        help='layers to build and warm up on start, layers with an address '
+                             'of this node in IP table by default')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='number of warm-up runs of each layer before the node reports ready')
+    parser.add_argument('--weights', metavar='DIR',
+                        help='weight store written by weights.py, random weights if not set')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='directory of frozen graph cache, models are built every start if not set')
+    parser.add_argument('-e', '--engine', choices=['tensorflow', 'numpy'], default='tensorflow',
+                        help='engine running the models, numpy runs dense layers from weight store '
+                             'without importing TensorFlow')
+    parser.add_argument('--int8', action='store_true', default=False,
+                        help='quantize dense kernels to int8 with a scale per output neuron, numpy engine only')
+    parser.set_defaults(**topology.defaults())
+    cmd = parser.parse_args()
+    main(cmd)
@@ -0,0 +1,256 @@
+"""
+    This module plans how the model is cut into stages and how many devices
+    run each stage, instead of picking the blocks in model.py by hand.
+
+    Profile: Each layer of the whole model (model.layers) is run on its own on
+    this device, so run it on the device class of the nodes. The time of an
+    empty model with the same input is taken off, which is the predict call
+    overhead. Weight bytes and output shape of each layer are recorded too.
+
+    Plan: The layers are cut into contiguous stages, each stage runs on one or
+    more devices that take frames in turn. With link bandwidth B, a stage of
+    compute time c, input of a bytes and output of b bytes on r devices takes
+    max(c, a / B, b / B) / r per frame, the slowest stage sets throughput.
+    Latency of a frame is the compute time of all stages plus the time to
+    send every cut over a link. Dynamic programming over cut points and
+    device counts finds the plan with the highest throughput, or the lowest
+    latency, where every stage fits in device memory. Devices left over are
+    given to the slowest stages.
+
+    The plan is written as a topology file with part builders of model.py and
+    an IP table with device addresses, ready for node.py and initial.py. Stages
+    split across devices by fan-out or by output neurons are not planned.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from keras import backend as K
+from keras.layers import Activation, Input
+from keras.models import Model
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import model as ml
+import topology
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def timeit(model, X, runs):
+    model.predict(X)
+    start = time.time()
+    for _ in range(runs):
+        model.predict(X)
+    return (time.time() - start) / runs
+
+
+def profile(runs, dtype):
+    """
+        Profile each layer of the whole model on this device.
+
+        Args:
+            runs: Number of runs of each layer.
+            dtype: Data type of model input.
+
+        Returns:
+            List of dictionaries with layer name, compute time, weight bytes,
+            input shape and data type, and output shape.
+    """
+    shapes = ml.shapes()
+    result = []
+    for k in range(len(shapes) - 1):
+        X = np.random.rand(1, *shapes[k]).astype(dtype if k == 0 else np.float32)
+        model = ml.part(k, k + 1)
+        interval = timeit(model, X, runs)
+        image = Input(shape=shapes[k])
+        overhead = timeit(Model(image, Activation('linear')(image)), X, runs)
+        result.append({'layer': model.layers[-1].name, 'time': max(0.0, interval - overhead),
+                       'weights': model.count_params() * 4, 'input': list(shapes[k]),
+                       'dtype': str(X.dtype), 'output': list(shapes[k + 1])})
+        print '{:>3d} {:24s} {:.4f} sec'.format(k, result[-1]['layer'], result[-1]['time'])
+        # layers are built one by one, so the graph does not keep all of them.
+        K.clear_session()
+    return result
+
+
+def size(shape, dtype='float32'):
+    return int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+
+class Plan(object):
+    """
+        Stages of a plan.
+
+        Attributes:
+            layers: Profile of each layer.
+            bandwidth: Link bandwidth in bytes per second.
+            stages: List of [first layer, last layer (exclusive), number of devices].
+    """
+
+    def __init__(self, layers, bandwidth, stages):
+        self.layers = layers
+        self.bandwidth = bandwidth
+        self.stages = stages
+
+    def stage(self, first, last, replicas):
+        """ Tuple of compute time, input bytes, output bytes and time per frame of a stage. """
+        compute = sum(layer['time'] for layer in self.layers[first:last])
+        received = size(self.layers[first]['input'], self.layers[first]['dtype'])
+        sent = size(self.layers[last - 1]['output'])
+        return compute, received, sent, max(compute, received / self.bandwidth, sent / self.bandwidth) / replicas
+
+    @property
+    def period(self):
+        """ Time per frame of the slowest stage. """
+        return max(self.stage(*stage)[3] for stage in self.stages)
+
+    @property
+    def latency(self):
+        total = 0.0
+        for first, last, replicas in self.stages:
+            compute, received, _, _ = self.stage(first, last, replicas)
+            total += compute + received / self.bandwidth
+        return total + size(self.layers[-1]['output']) / self.bandwidth
+
+    def key(self, objective):
+        return (self.period, self.latency) if objective == 'throughput' else (self.latency, self.period)
+
+    def spread(self, devices):
+        """ Give devices left over to the slowest stage, one at a time. """
+        while sum(replicas for _, _, replicas in self.stages) < devices:
+            slowest = max(self.stages, key=lambda stage: self.stage(*stage)[3])
+            slowest[2] += 1
+
+    def report(self):
+        lines = ['{:>6s} {:>8s} {:>8s} {:>10s} {:>12s} {:>12s} {:>10s}'.format(
+            'stage', 'layers', 'devices', 'compute', 'in bytes', 'out bytes', 'period')]
+        for k, (first, last, replicas) in enumerate(self.stages):
+            compute, received, sent, period = self.stage(first, last, replicas)
+            lines.append('{:>6d} {:>3d}-{:<4d} {:>8d} {:>10.4f} {:>12d} {:>12d} {:>10.4f}'.format(
+                k + 1, first, last, replicas, compute, received, sent, period))
+        lines.append('throughput: {:.2f} fps, latency: {:.3f} sec'.format(1 / self.period, self.latency))
+        return '\n'.join(lines)
+
+
+def search(layers, devices, bandwidth, memory=0, objective='throughput'):
+    """
+        Find the best plan.
+
+        Args:
+            layers: Profile of each layer.
+            devices: Number of devices.
+            bandwidth: Link bandwidth in bytes per second.
+            memory: Weight bytes a device can hold, 0 for no limit.
+            objective: throughput or latency.
+
+        Returns:
+            Best plan, None if no plan fits in memory.
+    """
+    # best[(i, d)] is the best plan of first i layers on d devices.
+    best = {(0, 0): Plan(layers, bandwidth, [])}
+    for i in range(1, len(layers) + 1):
+        for j in range(i):
+            if memory > 0 and sum(layer['weights'] for layer in layers[j:i]) > memory:
+                continue
+            for used in range(devices):
+                if (j, used) not in best:
+                    continue
+                # with latency objective, more devices on a stage do not help, they are spread later.
+                for replicas in range(1, devices - used + 1 if objective == 'throughput' else 2):
+                    plan = Plan(layers, bandwidth, [list(stage) for stage in best[(j, used)].stages] +
+                                [[j, i, replicas]])
+                    current = best.get((i, used + replicas))
+                    if current is None or plan.key(objective) < current.key(objective):
+                        best[(i, used + replicas)] = plan
+    plans = [best[(len(layers), used)] for used in range(1, devices + 1) if (len(layers), used) in best]
+    if not plans:
+        return None
+    plan = min(plans, key=lambda plan: plan.key(objective))
+    plan.spread(devices)
+    return plan
+
+
+def write(plan, path, hosts, initial):
+    """
+        Write plan as topology file and IP table.
+
+        Args:
+            plan: Plan to write.
+            path: Directory of topology file and IP table.
+            hosts: Device addresses, one for each device in the plan.
+            initial: Address of initializer.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    lines = ['# Planned by planner.py, {:.2f} fps and {:.3f} sec latency expected.'.format(
+        1 / plan.period, plan.latency), 'stages:']
+    node, codec = {'initial': [initial]}, {'initial': 'raw'}
+    for k, (first, last, replicas) in enumerate(plan.stages):
+        name = 'stage{:d}'.format(k + 1)
+        layer = plan.layers[first]
+        lines.append('    - name: {:s}'.format(name))
+        lines.append('      model: part')
+        lines.append('      args: [{:d}, {:d}]'.format(first, last))
+        lines.append('      input: {{dtype: {:s}, shape: {:s}}}'.format(layer['dtype'], json.dumps(layer['input'])))
+        lines.append('      next: {:s}'.format('stage{:d}'.format(k + 2) if k + 1 < len(plan.stages) else 'initial'))
+        node[name], hosts = hosts[:replicas], hosts[replicas:]
+        codec[name] = 'raw' if k == 0 else 'auto'
+    with open(os.path.join(path, 'topology'), 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+    with open(os.path.join(path, 'ip'), 'w') as file:
+        file.write(json.dumps({'node': node, 'codec': codec}, indent=4, sort_keys=True) + '\n')
+
+
+def main(cmd):
+    if cmd.load is not None:
+        with open(cmd.load) as file:
+            layers = json.load(file)
+    else:
+        layers = profile(cmd.runs, topology.load(table=None).first.dtype)
+    if cmd.save is not None:
+        with open(cmd.save, 'w') as file:
+            json.dump(layers, file, indent=4)
+
+    current = topology.load()
+    hosts = cmd.hosts or [addr for name in current.stages for addr in current.replicas.get(name, [])]
+    devices = cmd.devices or len(hosts)
+    plan = search(layers, devices, cmd.bandwidth * 1e6 / 8, cmd.memory * 2 ** 20, cmd.objective)
+    if plan is None:
+        print 'no plan fits in {:d} devices with {:.0f} MB each'.format(devices, cmd.memory)
+        return
+    print plan.report()
+    if cmd.output is not None:
+        if len(hosts) < devices:
+            raise ValueError('plan needs {} device addresses, got {}'.format(devices, len(hosts)))
+        write(plan, cmd.output, hosts, cmd.initial or current.replicas['initial'][0])
+        print 'topology and IP table written to {:s}'.format(cmd.output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--devices', type=int, default=0,
+                        help='number of devices, all devices in IP table by default')
+    parser.add_argument('-b', '--bandwidth', type=float, default=50.0,
+                        help='link bandwidth in Mbit/s')
+    parser.add_argument('-m', '--memory', type=float, default=0.0,
+                        help='MB of weights a device can hold, 0 for no limit')
+    parser.add_argument('--objective', choices=['throughput', 'latency'], default='throughput',
+                        help='maximize throughput or minimize latency')
+    parser.add_argument('-r', '--runs', type=int, default=10,
+                        help='number of runs of each layer when profiling')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save layer profile, so it can be planned on another machine')
+    parser.add_argument('--load', metavar='FILE',
+                        help='load layer profile instead of profiling')
+    parser.add_argument('--hosts', nargs='+',
+                        help='device addresses of the plan, devices in IP table by default')
+    parser.add_argument('--initial', help='address of initializer, the one in IP table by default')
+    parser.add_argument('-o', '--output', metavar='DIR',
+                        help='write planned topology and IP table to this directory')
+    cmd = parser.parse_args()
+    main(cmd)
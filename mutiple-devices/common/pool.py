@@ -0,0 +1,217 @@
+"""
+    This module keeps persistent connections to other devices. Instead of
+    building a new HTTPTransceiver for every frame, a sender borrows an idle
+    keep-alive connection to the same address from the pool and puts it back
+    after the request, so the TCP handshake is only paid once per device.
+    The pool works with any connection type that has sock, request, ping, ready
+    and close, AvroConnection here or TensorConnection for raw TCP transport.
+"""
+import httplib
+import select
+import time
+from collections import deque
+from threading import Lock
+
+import avro.ipc as ipc
+
+from wire import FrameRejected
+
+# errors that mean the connection is broken and should be rebuilt
+CONNECTION_ERRORS = (IOError, httplib.HTTPException, ipc.ConnectionClosedException)
+# errors answered by the other side, the connection can be used again
+REMOTE_ERRORS = (FrameRejected, ipc.AvroRemoteException)
+
+
+def split(address, port):
+    """
+        Split IP table address. An address can carry its own port as host:port,
+        so several layers can run on one host.
+
+        Args:
+            address: Address from IP table.
+            port: Default port.
+
+        Returns:
+            Tuple of host and port.
+    """
+    host, _, custom = address.partition(':')
+    return host, int(custom) if custom else port
+
+
+class AvroConnection(object):
+    """ Avro requestor over a keep-alive HTTP connection. """
+
+    def __init__(self, protocol, address, port):
+        self.client = ipc.HTTPTransceiver(address, port)
+        self.requestor = ipc.Requestor(protocol, self.client)
+
+    @property
+    def sock(self):
+        return self.client.conn.sock
+
+    def request(self, message, data):
+        return self.requestor.request(message, data)
+
+    def ping(self):
+        """ Clock of the other side. """
+        return self.requestor.request('ping', dict())
+
+    def ready(self):
+        """ If the other side is ready to run frames. """
+        return self.requestor.request('ready', dict())
+
+    def close(self):
+        self.client.close()
+
+
+class ConnectionPool(object):
+    """
+        Pool of persistent connections keyed by (address, port). The
+        addresses themselves are still scheduled by the IP Queue of each
+        model, the pool only makes sure a connection to that address is
+        reused across frames.
+
+        Attributes:
+            connect: Function opens a new connection to (address, port).
+            timeout: Idle seconds after which a pooled connection is closed
+                    instead of reused, it should be shorter than the server side
+                    keep-alive timeout.
+            retries: Number of reconnects for a single request.
+            idle: A dictionary maps (address, port) to deque of idle connections.
+            stat: A dictionary maps (address, port) to connection counters.
+            lock: Threading lock for idle table and counters.
+    """
+
+    def __init__(self, connect, timeout=30.0, retries=1):
+        self.connect = connect
+        self.timeout = timeout
+        self.retries = retries
+        self.idle = dict()
+        self.stat = dict()
+        self.lock = Lock()
+
+    def counter(self, key):
+        if key not in self.stat:
+            self.stat[key] = {'created': 0, 'reused': 0, 'reconnect': 0, 'connect': 0.0}
+        return self.stat[key]
+
+    @staticmethod
+    def healthy(conn):
+        """
+            Health check for an idle connection. An idle keep-alive socket should
+            never be readable, if it is, the other side has closed it or sent
+            garbage, so it can not be used for next request.
+        """
+        sock = conn.sock
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (select.error, IOError, ValueError):
+            return False
+        return len(readable) == 0
+
+    def acquire(self, address, port):
+        """
+            Borrow a healthy idle connection, or open a new one.
+
+            Args:
+                address: IP address of device.
+                port: Port of device.
+
+            Returns:
+                Tuple of connection and a flag if the connection is reused.
+        """
+        key = (address, port)
+        with self.lock:
+            idle = self.idle.setdefault(key, deque())
+            while len(idle) > 0:
+                conn, last = idle.pop()
+                if time.time() - last < self.timeout and self.healthy(conn):
+                    self.counter(key)['reused'] += 1
+                    return conn, True
+                conn.close()
+
+        start = time.time()
+        conn = self.connect(address, port)
+        interval = time.time() - start
+        with self.lock:
+            stat = self.counter(key)
+            stat['created'] += 1
+            stat['connect'] += interval
+        return conn, False
+
+    def release(self, address, port, conn):
+        """ Put connection back for later requests to the same device. """
+        with self.lock:
+            self.idle.setdefault((address, port), deque()).append((conn, time.time()))
+
+    def request(self, address, port, *args):
+        """
+            Send a request through pooled connection. A broken connection is closed
+            and the request is sent again on a new connection.
+
+            Args:
+                address: IP address of device.
+                port: Port of device.
+                args: Arguments of connection request, message name and datum for
+                        Avro connection.
+
+            Returns:
+                Response of the request.
+
+            Raises:
+                IOError, HTTPException: if the request still fails after retries.
+                FrameRejected, AvroRemoteException: if the other side failed to
+                        handle the request, it is not sent again.
+        """
+        return self.call(address, port, 'request', *args)
+
+    def ping(self, address, port):
+        """ Clock of device, through pooled connection like request. """
+        return self.call(address, port, 'ping')
+
+    def ready(self, address, port):
+        """ If device is ready to run frames, through pooled connection like request. """
+        return self.call(address, port, 'ready')
+
+    def call(self, address, port, method, *args):
+        """ Call a method of pooled connection, reconnect if it is broken. """
+        attempt = 0
+        while True:
+            conn, reused = self.acquire(address, port)
+            try:
+                response = getattr(conn, method)(*args)
+            except REMOTE_ERRORS:
+                self.release(address, port, conn)
+                raise
+            except CONNECTION_ERRORS:
+                conn.close()
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                with self.lock:
+                    self.counter((address, port))['reconnect'] += 1
+                continue
+            self.release(address, port, conn)
+            return response
+
+    def report(self):
+        """ Summary of how often connections are reused and handshake time saved. """
+        with self.lock:
+            created = sum(stat['created'] for stat in self.stat.values())
+            reused = sum(stat['reused'] for stat in self.stat.values())
+            reconnect = sum(stat['reconnect'] for stat in self.stat.values())
+            connect = sum(stat['connect'] for stat in self.stat.values())
+        total = created + reused
+        if total == 0:
+            return 'reuse: n/a'
+        saved = reused * connect / created if created > 0 else 0.0
+        return 'reuse: {:.1%} ({:d}/{:d}), reconnect: {:d}, saved: {:.3f} sec'.format(
+            float(reused) / total, reused, total, reconnect, saved)
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                while len(idle) > 0:
+                    idle.pop()[0].close()
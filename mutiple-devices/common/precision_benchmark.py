@@ -0,0 +1,113 @@
+"""
+    This module compares stages built in reduced precision, see
+    model.precision, with the float32 reference, to choose the precision of
+    each stage. Frames run through the stages of the topology in float32, each
+    stage as one whole model even when it is split or tiled. Then each stage
+    runs again in each precision on the same inputs with the same weights,
+    followed by the rest of the pipeline in float32. For each stage and
+    precision it prints milliseconds per batch, the largest difference of
+    the stage output relative to the largest float32 output, and how often
+    the top-1 class of the pipeline stays the same.
+
+    With random weights activations grow from layer to layer, so use pretrained
+    weights of the whole model to see the accuracy of real frames.
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import model as ml
+import runner
+import topology
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def whole(stage, precision='float32'):
+    """ Stage built as one model in precision, a split stage as its only slice. """
+    stage = copy.copy(stage)
+    stage.parts = 1
+    stage.precision = precision
+    return stage
+
+
+def assign(models, path):
+    """ Hand the weights of the whole model in Keras HDF5 to the stage models in order. """
+    model = ml.part(0, len(ml.layers()))
+    model.load_weights(path)
+    layers = [layer.get_weights() for layer in model.layers if layer.weights]
+    for stage in models:
+        count = len([layer for layer in stage.layers if layer.weights])
+        stage.set_weights([array for weights in layers[:count] for array in weights])
+        layers = layers[count:]
+
+
+def predict(model, X, size):
+    return np.concatenate([model.predict(X[k:k + size]) for k in range(0, len(X), size)])
+
+
+def timeit(model, X, runs):
+    model.predict(X)
+    start = time.time()
+    for _ in range(runs):
+        model.predict(X)
+    return (time.time() - start) / runs
+
+
+def main(cmd):
+    stages = [whole(stage) for stage in topology.load().stages.values()]
+    models = [stage.builder(ml)() for stage in stages]
+    if cmd.input is not None:
+        assign(models, cmd.input)
+    runners = [runner.Runner(model) for model in models]
+
+    np.random.seed(0)
+    first = stages[0]
+    outputs = [(np.random.rand(cmd.frames, *first.shape) * 255).astype(first.dtype)]
+    for model in runners:
+        outputs.append(predict(model, outputs[-1], cmd.batch))
+    classes = outputs[-1].argmax(axis=-1)
+
+    print '{:>10s} {:>10s} {:>10s} {:>8s} {:>10s} {:>7s}'.format(
+        'stage', 'precision', 'ms', 'speedup', 'rel diff', 'top-1')
+    for k, stage in enumerate(stages):
+        X = outputs[k][:cmd.batch]
+        reference = timeit(runners[k], X, cmd.runs)
+        print '{:>10s} {:>10s} {:>10.3f} {:>7.2f}x {:>10.2e} {:>6.0%}'.format(
+            stage.name, 'float32', reference * 1e3, 1.0, 0.0, 1.0)
+        for precision in cmd.precision:
+            reduced = whole(stage, precision).builder(ml)()
+            reduced.set_weights(models[k].get_weights())
+            reduced = runner.Runner(reduced)
+            Y = predict(reduced, outputs[k], cmd.batch)
+            error = np.abs(Y - outputs[k + 1]).max() / max(np.abs(outputs[k + 1]).max(), 1e-12)
+            for model in runners[k + 1:]:
+                Y = predict(model, Y, cmd.batch)
+            seconds = timeit(reduced, X, cmd.runs)
+            print '{:>10s} {:>10s} {:>10.3f} {:>7.2f}x {:>10.2e} {:>6.0%}'.format(
+                stage.name, precision, seconds * 1e3, reference / seconds, error,
+                np.mean(Y.argmax(axis=-1) == classes))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', metavar='FILE',
+                        help='Keras HDF5 weights of the whole model, random weights if not set')
+    parser.add_argument('-p', '--precision', nargs='+', default=['float16'],
+                        choices=[precision for precision in topology.PRECISIONS if precision != 'float32'],
+                        help='reduced precisions to compare with float32')
+    parser.add_argument('-n', '--frames', type=int, default=16,
+                        help='number of random frames run through the pipeline')
+    parser.add_argument('-b', '--batch', type=int, default=1,
+                        help='batch size of each call')
+    parser.add_argument('-r', '--runs', type=int, default=10,
+                        help='number of calls to time')
+    cmd = parser.parse_args()
+    main(cmd)
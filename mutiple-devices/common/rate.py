@@ -0,0 +1,118 @@
+"""
+    This module controls the frame rate of the data sender. It watches the
+    results coming back from the last layer and adjusts the rate AIMD style:
+    the rate grows by a fixed step while the pipeline keeps up, and is cut by
+    a factor as soon as queues build up. Queues show up as latency above the
+    latency of an empty pipeline, or above a target latency if one is given,
+    and as frames dropped by the sender or lost in the pipeline.
+"""
+import time
+from threading import Lock
+
+
+class RateController(object):
+    """
+        Additive increase, multiplicative decrease controller of frame rate.
+
+        Attributes:
+            rate: Current frames per second.
+            low: Lowest rate.
+            high: Highest rate.
+            step: Frames per second added after a period without congestion.
+            factor: Rate is multiplied by it after a period with congestion.
+            target: Latency in seconds seen as congestion, 0 to use base latency
+                    with tolerance.
+            tolerance: Fraction above base latency seen as congestion.
+            period: Seconds between adjustments.
+            timeout: Seconds after which a frame without result is lost.
+            base: Lowest latency seen, latency of an empty pipeline.
+            sent: A dictionary maps frame id to send time of frames in flight.
+            latency: Latencies of frames completed in this period.
+            lost: Number of frames lost in this period.
+            dropped: Number of frames dropped by sender at last adjustment.
+            last: Time of last adjustment.
+            lock: Threading lock for frame records.
+    """
+
+    def __init__(self, rate=30.0, low=0.5, high=100.0, step=1.0, factor=0.5, target=0.0,
+                 tolerance=0.5, period=2.0, timeout=10.0):
+        self.rate = rate
+        self.low = low
+        self.high = high
+        self.step = step
+        self.factor = factor
+        self.target = target
+        self.tolerance = tolerance
+        self.period = period
+        self.timeout = timeout
+        self.base = None
+        self.sent = dict()
+        self.latency = []
+        self.lost = 0
+        self.dropped = 0
+        self.last = time.time()
+        self.lock = Lock()
+
+    def interval(self):
+        """ Seconds between frames. """
+        return 1.0 / self.rate
+
+    def start(self, frame_id):
+        """ Record a frame sent into the pipeline. """
+        with self.lock:
+            self.sent[frame_id] = time.time()
+
+    def complete(self, frame_id):
+        """ Record the result of a frame. """
+        with self.lock:
+            start = self.sent.pop(frame_id, None)
+            if start is not None:
+                latency = time.time() - start
+                self.latency.append(latency)
+                self.base = latency if self.base is None else min(self.base, latency)
+
+    def limit(self):
+        """ Latency from which the pipeline is congested. """
+        if self.target > 0:
+            return self.target
+        return self.base * (1 + self.tolerance) if self.base is not None else float('inf')
+
+    def update(self, dropped=0):
+        """
+            Adjust the rate once a period.
+
+            Args:
+                dropped: Total number of frames dropped by sender.
+
+            Returns:
+                Log message of rate change, or None if the period is not over or
+                the rate is at its bound.
+        """
+        now = time.time()
+        if now - self.last < self.period:
+            return None
+        with self.lock:
+            for frame_id in [k for k, start in self.sent.items() if now - start > self.timeout]:
+                del self.sent[frame_id]
+                self.lost += 1
+            latency = sum(self.latency) / len(self.latency) if self.latency else 0.0
+            throughput = len(self.latency) / (now - self.last)
+            flight = len(self.sent)
+            # no result in this period while frames are overdue also means queues grow.
+            stalled = not self.latency and any(now - start > self.limit() for start in self.sent.values())
+            congested = dropped > self.dropped or self.lost > 0 or stalled or latency > self.limit()
+            self.latency = []
+            self.lost = 0
+            self.dropped = dropped
+            self.last = now
+
+        rate = self.rate
+        if congested:
+            self.rate = max(self.low, self.rate * self.factor)
+        else:
+            self.rate = min(self.high, self.rate + self.step)
+        if self.rate == rate:
+            return None
+        return 'rate: {:.1f} -> {:.1f} fps, throughput: {:.1f} fps, in flight: {:d}, ' \
+               'latency: {:.3f} sec (limit {:.3f})'.format(rate, self.rate, throughput, flight,
+                                                           latency, self.limit())
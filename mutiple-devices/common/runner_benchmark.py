@@ -0,0 +1,75 @@
+"""
+    This module compares Keras predict with the session callable of runner.py
+    for the model of each stage, one slice of a split stage. Each call runs a
+    batch of random input. The callable is timed with a new input array for
+    every call and with the input array kept and reused. Outputs are new arrays
+    in both cases.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import model as ml
+import runner
+import topology
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def timeit(call, runs):
+    call()
+    start = time.time()
+    for _ in range(runs):
+        call()
+    return (time.time() - start) / runs
+
+
+def compare(stage, size, runs):
+    """
+        Time a stage model run in each way.
+
+        Returns:
+            Tuple of seconds per call of predict, callable and callable with reused input.
+    """
+    model = stage.builder(ml)()
+    fast = runner.Runner(model)
+    X = (np.random.rand(size, *stage.shape) * 255).astype(stage.dtype)
+    inputs = fast.inputs(size)
+    inputs[...] = X
+
+    reference = model.predict(X)
+    error = np.abs(fast.predict(X) - reference).max()
+    if error > 1e-5:
+        raise ValueError('callable output of {} differs from predict by {:.2e}'.format(stage.name, error))
+    return (timeit(lambda: model.predict(np.array(list(X))), runs),
+            timeit(lambda: fast.predict(np.array(list(X))), runs),
+            timeit(lambda: fast.predict(inputs), runs))
+
+
+def main(cmd):
+    stages = topology.load().stages
+    print '{:>12s} {:>6s} {:>12s} {:>12s} {:>12s} {:>8s}'.format(
+        'stage', 'batch', 'predict ms', 'callable ms', 'reused in ms', 'speedup')
+    for name in cmd.stages or stages.keys():
+        for size in cmd.batch:
+            predict, call, reused = compare(stages[name], size, cmd.runs)
+            print '{:>12s} {:>6d} {:>12.3f} {:>12.3f} {:>12.3f} {:>7.2f}x'.format(
+                name, size, predict * 1e3, call * 1e3, reused * 1e3, predict / reused)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--stages', nargs='+',
+                        help='stages to compare, all stages in topology by default')
+    parser.add_argument('-b', '--batch', type=int, nargs='+', default=[1],
+                        help='batch sizes to compare')
+    parser.add_argument('-r', '--runs', type=int, default=50,
+                        help='number of calls to time')
+    cmd = parser.parse_args()
+    main(cmd)
@@ -0,0 +1,171 @@
+"""
+    This module defines shared memory transport for layers running on the same
+    host. The sender writes the encoded packet once into a ring buffer in a
+    memory-mapped file, and only a small pointer packet with file path, offset
+    and size goes through Avro or raw TCP. The receiver maps the same file and
+    decodes the packet in place.
+
+    A connection carries packets of one sender, so the handler thread of the
+    connection holds the map of its ring. The map is dropped when the thread
+    gets packets of another ring or calls release on exit, and closed once no
+    handler thread holds it, so rings of senders that are gone are unmapped.
+"""
+import atexit
+import mmap
+import os
+import socket
+import tempfile
+from threading import Condition, Lock, local as thread_local
+
+import numpy as np
+
+# tmpfs on Linux, so the file never hits disk.
+DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# receiver side cache of mapped files, path -> [mmap, number of handler threads holding it]
+attached = dict()
+attach_lock = Lock()
+# path of the map held by each handler thread
+held = thread_local()
+
+# host -> flag if it is this machine
+local_hosts = dict()
+
+
+def local(host):
+    """
+        Check if host is an address of this machine. A UDP socket connected to
+        a local address picks the same address as its source.
+
+        Args:
+            host: IP address or host name.
+
+        Returns:
+            True if packets to host never leave this machine.
+    """
+    if host not in local_hosts:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            address = socket.gethostbyname(host)
+            sock.connect((address, 9))
+            local_hosts[host] = address.startswith('127.') or sock.getsockname()[0] == address
+        except (socket.error, IOError):
+            local_hosts[host] = False
+        finally:
+            sock.close()
+    return local_hosts[host]
+
+
+def attach(path):
+    """
+        Map file written by a sender on this host, read only. The calling thread
+        holds the map until it attaches another file or calls release, arrays
+        decoded from the map must not be used after that.
+    """
+    with attach_lock:
+        current = getattr(held, 'path', None)
+        if current != path:
+            if path not in attached:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    attached[path] = [mmap.mmap(fd, 0, access=mmap.ACCESS_READ), 0]
+                finally:
+                    os.close(fd)
+            attached[path][1] += 1
+            held.path = path
+            if current is not None:
+                drop(current)
+        return attached[path][0]
+
+
+def drop(path):
+    """ Let go of a held map and close it if no thread holds it, called with lock held. """
+    entry = attached[path]
+    entry[1] -= 1
+    if entry[1] == 0:
+        del attached[path]
+        entry[0].close()
+
+
+def release():
+    """ Let go of the map held by the calling thread, called when a handler exits. """
+    with attach_lock:
+        path = getattr(held, 'path', None)
+        if path is not None:
+            held.path = None
+            drop(path)
+
+
+class Ring(object):
+    """
+        Ring buffer in a memory-mapped file. Packets are written one after another
+        and wrap to the beginning when the end is reached. A region stays busy
+        until the receiver has handled the packet, so writer waits instead of
+        overwriting data in use.
+
+        Attributes:
+            path: Path of mapped file.
+            size: Size of mapped file.
+            map: Writable mmap of file.
+            head: Offset for next packet.
+            busy: A dictionary maps offset to size of regions in use.
+            cond: Condition for waiting busy regions.
+    """
+
+    def __init__(self, size=32 << 20):
+        fd, self.path = tempfile.mkstemp(prefix='musical-chair-', dir=DIRECTORY)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        atexit.register(self.close)
+        self.size = size
+        self.head = 0
+        self.busy = dict()
+        self.cond = Condition()
+
+    def allocate(self, size):
+        with self.cond:
+            while True:
+                offset = self.head if self.head + size <= self.size else 0
+                if all(offset + size <= start or start + length <= offset
+                       for start, length in self.busy.items()):
+                    self.busy[offset] = size
+                    self.head = offset + size
+                    return offset
+                self.cond.wait()
+
+    def write(self, head, body):
+        """
+            Copy encoded packet into ring buffer.
+
+            Args:
+                head: Packet header byte string.
+                body: Packet body, numpy array or byte string.
+
+            Returns:
+                Tuple of offset and size of packet, the region must be freed after
+                receiver has handled it.
+
+            Raises:
+                ValueError: if packet is larger than ring buffer.
+        """
+        body = np.frombuffer(body, np.uint8) if isinstance(body, str) \
+            else np.ascontiguousarray(body).reshape(-1).view(np.uint8)
+        size = len(head) + body.nbytes
+        if size > self.size:
+            raise ValueError('packet of {:d} bytes does not fit ring buffer'.format(size))
+        offset = self.allocate(size)
+        self.map[offset:offset + len(head)] = head
+        np.frombuffer(self.map, np.uint8, body.nbytes, offset + len(head))[:] = body
+        return offset, size
+
+    def free(self, offset):
+        with self.cond:
+            del self.busy[offset]
+            self.cond.notify_all()
+
+    def close(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,100 @@
+"""
+    This module checks split layers against the whole layer. Weights of the
+    whole layer are cut into slices as each device of a split stage holds
+    them, every slice runs on its own and the outputs are joined as the merge
+    stage does. The result has to match model.predict of the whole layer. It
+    also shows the weight bytes and time of each slice, since slices run on
+    different devices at the same time.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import model as ml
+import topology
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def timeit(model, X, runs):
+    model.predict(X)
+    start = time.time()
+    for _ in range(runs):
+        output = model.predict(X)
+    return output, (time.time() - start) / runs
+
+
+def check(stage, parts, runs, tolerance):
+    """
+        Compare joined slices and whole output of a split stage.
+
+        Returns:
+            True if they match within tolerance.
+    """
+    builder = getattr(ml, stage.model)
+    # the whole layer is the one slice of a layer split into one part.
+    whole = builder(*(stage.args + ([None] if stage.split == 'sum' else [0, 1])))
+    X = np.random.rand(1, *stage.shape).astype(stage.dtype)
+    reference, total = timeit(whole, X, runs)
+
+    outputs, times, sizes = [], [], []
+    for part in range(parts):
+        model = builder(*(stage.args + [part, parts]))
+        model.set_weights(ml.slices(whole.get_weights(), part, parts))
+        output, interval = timeit(model, X, runs)
+        outputs.append(output)
+        times.append(interval)
+        sizes.append(model.count_params() * 4)
+    if stage.split == 'sum':
+        output = ml.softmax().predict(np.sum(outputs, axis=0))
+    else:
+        output = np.concatenate(outputs, axis=-1)
+
+    error = np.abs(output - reference).max() if output.shape == reference.shape else float('inf')
+    print '{:s} in {:d} slices, max error: {:.2e}, {:s}'.format(
+        stage.name, parts, error, 'ok' if error <= tolerance else 'MISMATCH')
+    for part, (size, interval) in enumerate(zip(sizes, times)):
+        print '    slice {:d}: {:.1f} MB of weights, {:.3f} sec'.format(part, size / 2.0 ** 20, interval)
+    print '    whole layer: {:.1f} MB of weights, {:.3f} sec, slowest slice: {:.3f} sec'.format(
+        whole.count_params() * 4 / 2.0 ** 20, total, max(times))
+    return error <= tolerance
+
+
+def main(cmd):
+    current = topology.load()
+    stages = current.stages
+    if cmd.stage is not None:
+        names = [cmd.stage]
+    else:
+        names = [name for name, stage in stages.items() if stage.split is not None]
+    if len(names) == 0:
+        raise ValueError('no split stage in topology, pick one with -s')
+    passed = True
+    for name in names:
+        stage = stages[name]
+        stage.split = stage.split or cmd.split
+        for parts in cmd.parts or [stage.parts]:
+            passed = check(stage, parts, cmd.runs, cmd.tolerance) and passed
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--stage',
+                        help='stage to check, all split stages in topology by default')
+    parser.add_argument('--split', choices=['concat', 'sum'], default='concat',
+                        help='how slices are merged, if the stage is not split in topology')
+    parser.add_argument('-n', '--parts', type=int, nargs='+',
+                        help='numbers of slices to check, devices of the stage by default')
+    parser.add_argument('-r', '--runs', type=int, default=3,
+                        help='number of runs to time')
+    parser.add_argument('--tolerance', type=float, default=1e-5,
+                        help='largest absolute difference allowed')
+    cmd = parser.parse_args()
+    main(cmd)
@@ -0,0 +1,169 @@
+"""
+    This module runs layer inference apart from the request handler. A request
+    is acknowledged as soon as its input is queued, and worker threads drain the
+    queue and run the model. The queue is bounded, when it is full the handler
+    blocks, so the previous layer waits instead of piling up frames.
+
+    A worker takes up to batch tasks at once, waiting a short time for the
+    batch to fill, so the model runs on several frames in one predict.
+
+    Each stage of a node has its own executor, so no lock is held around model
+    inference and requests keep decoding while workers run the model. A request
+    that has to wait for the result calls the executor and blocks only itself.
+
+    Overflow policies for a full queue:
+        block: Wait until a task is taken.
+        drop-oldest: Drop the task queued longest ago, keeps the latest frames.
+        drop-newest: Drop the new task.
+"""
+import time
+import traceback
+from Queue import Queue, Empty, Full
+from threading import Event, Thread, Lock
+
+POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+
+class BatchStat(object):
+    """
+        Throughput and latency statistics for each batch size.
+
+        Attributes:
+            stat: A dictionary maps batch size to [count, run time, latency].
+            lock: Threading lock for stat.
+    """
+
+    def __init__(self):
+        self.stat = dict()
+        self.lock = Lock()
+
+    def add(self, size, interval, latency):
+        """
+            Record one batch.
+
+            Args:
+                size: Number of tasks in batch.
+                interval: Time to run the batch.
+                latency: Total time tasks spent from queued to finished.
+        """
+        with self.lock:
+            stat = self.stat.setdefault(size, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += interval
+            stat[2] += latency
+
+    def totals(self):
+        """ Number of tasks run and run time of all batches. """
+        with self.lock:
+            return (sum(size * count for size, (count, _, _) in self.stat.items()),
+                    sum(interval for _, interval, _ in self.stat.values()))
+
+    def report(self):
+        with self.lock:
+            return ', '.join('batch {:d}: {:.1f} fps, {:.3f} sec'.format(
+                size, size * count / interval if interval > 0 else 0.0, latency / (size * count))
+                for size, (count, interval, latency) in sorted(self.stat.items()))
+
+
+class StageExecutor(object):
+    """
+        Bounded input queue of a layer drained by worker threads.
+
+        Attributes:
+            handler: Function called with a list of task arguments.
+            queue: Bounded queue of tasks.
+            batch: Maximum number of tasks in one batch.
+            wait: Seconds to wait for a batch to fill.
+            policy: Overflow policy when the queue is full.
+            dropped: Number of tasks dropped by overflow policy.
+            stat: Statistics of batches.
+            lock: Threading lock for dropped counter.
+            threads: Worker threads.
+    """
+
+    def __init__(self, handler, size=4, workers=1, batch=1, wait=0.0, policy='block'):
+        if policy not in POLICIES:
+            raise ValueError('unknown overflow policy {}'.format(policy))
+        self.handler = handler
+        self.queue = Queue(size)
+        self.batch = batch
+        self.wait = wait
+        self.policy = policy
+        self.dropped = 0
+        self.stat = BatchStat()
+        self.lock = Lock()
+        self.threads = [Thread(target=self.run) for _ in range(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, *args):
+        """
+            Queue a task, a full queue is handled by overflow policy.
+
+            Returns:
+                True if the task is queued, False if it is dropped.
+        """
+        task = (time.time(), args, None)
+        if self.policy == 'block':
+            self.queue.put(task)
+            return True
+        while True:
+            try:
+                self.queue.put_nowait(task)
+                return True
+            except Full:
+                if self.policy == 'drop-newest':
+                    self.drop(None)
+                    return False
+            try:
+                _, _, done = self.queue.get_nowait()
+            except Empty:
+                continue
+            self.queue.task_done()
+            self.drop(done)
+
+    def drop(self, done):
+        with self.lock:
+            self.dropped += 1
+        if done is not None:
+            done.set()
+
+    def call(self, *args):
+        """ Queue a task and wait until a worker has run it, even if it failed. """
+        done = Event()
+        self.queue.put((time.time(), args, done))
+        done.wait()
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def take(self):
+        """ Take a batch, it is ready when full or when waiting time is up. """
+        tasks = [self.queue.get()]
+        deadline = time.time() + self.wait
+        while len(tasks) < self.batch:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                tasks.append(self.queue.get(timeout=timeout))
+            except Empty:
+                break
+        return tasks
+
+    def run(self):
+        while True:
+            tasks = self.take()
+            start = time.time()
+            try:
+                self.handler([args for _, args, _ in tasks])
+            except Exception:
+                traceback.print_exc()
+            finally:
+                end = time.time()
+                self.stat.add(len(tasks), end - start, sum(end - queued for queued, _, _ in tasks))
+                for _, _, done in tasks:
+                    if done is not None:
+                        done.set()
+                    self.queue.task_done()
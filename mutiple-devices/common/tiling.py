@@ -0,0 +1,96 @@
+"""
+    This module cuts the input of a convolutional layer into horizontal strips,
+    so each strip of a frame runs on a different device at the same time and
+    frame latency goes down, not only throughput.
+
+    A strip has to carry halo rows around the rows it owns: every 3x3 conv
+    reads one row more on each side, every pooling reads its whole window.
+    Going backward from the output rows a strip owns through each layer gives
+    the input rows it needs. The first row of a strip is rounded down to a
+    multiple of the product of the strides, so pooling windows of the strip
+    line up with those of the whole input. Rows a strip computes from zero
+    padding at its inner edges are outside the rows it owns, they are cut off
+    before the strips are stitched back along the row axis.
+
+    Supported layers are convolutions and pooling with stride 1 and same
+    padding, or any stride and valid padding, and elementwise Lambda layers
+    such as the casts of a reduced precision stage.
+"""
+import tensorflow as tf
+from keras.layers import Conv2D, MaxPooling2D, AveragePooling2D, InputLayer, Lambda
+from keras.models import Model, Input
+
+
+def rows(model):
+    """
+        Kernel size, stride and padding of each layer along the row axis.
+
+        Raises:
+            ValueError: if a layer can not run on strips.
+    """
+    result = []
+    for layer in model.layers:
+        if isinstance(layer, InputLayer):
+            continue
+        if isinstance(layer, Lambda) and layer.input_shape == layer.output_shape:
+            continue
+        if isinstance(layer, Conv2D):
+            kernel, stride = layer.kernel_size[0], layer.strides[0]
+        elif isinstance(layer, (MaxPooling2D, AveragePooling2D)):
+            kernel, stride = layer.pool_size[0], layer.strides[0]
+        else:
+            raise ValueError('layer {} can not run on strips'.format(layer.name))
+        if layer.padding == 'same' and stride != 1:
+            raise ValueError('layer {} with same padding has stride {}'.format(layer.name, stride))
+        result.append((kernel, stride, layer.padding))
+    return result
+
+
+class Tiling(object):
+    """
+        Strips of a layer input.
+
+        Attributes:
+            inputs: List of (first, last) input rows of each strip, halo included.
+            outputs: List of (first, last) rows of each strip output it owns, in
+                    rows of the strip output.
+            height: Number of output rows of whole input.
+    """
+
+    def __init__(self, layers, height, tiles):
+        align = 1
+        heights = [height]
+        for kernel, stride, padding in layers:
+            align *= stride
+            heights.append(heights[-1] if padding == 'same' else (heights[-1] - kernel) // stride + 1)
+        self.height = heights[-1]
+        if tiles > self.height:
+            raise ValueError('{} strips for {} output rows'.format(tiles, self.height))
+        self.inputs, self.outputs = [], []
+        for k in range(tiles):
+            owned = (self.height * k // tiles, self.height * (k + 1) // tiles)
+            first, last = owned
+            for (kernel, stride, padding), size in reversed(zip(layers, heights[:-1])):
+                if padding == 'same':
+                    first, last = max(0, first - (kernel - 1) // 2), min(size, last + kernel // 2)
+                else:
+                    first, last = first * stride, (last - 1) * stride + kernel
+            first -= first % align
+            self.inputs.append((first, last))
+            self.outputs.append((owned[0] - first // align, owned[1] - first // align))
+
+    @classmethod
+    def build(cls, builder, height, tiles):
+        """ Tiling from layers of a model builder, built in its own graph to leave the default one alone. """
+        with tf.Graph().as_default():
+            return cls(rows(builder()), height, tiles)
+
+
+def flexible(model):
+    """ Model sharing the layers and weights of model, with any number of input rows. """
+    image = Input(shape=(None,) + model.input_shape[2:])
+    layer = image
+    for block in model.layers:
+        if not isinstance(block, InputLayer):
+            layer = block(layer)
+    return Model(image, layer)
@@ -0,0 +1,115 @@
+"""
+    This module checks spatial tiling of a layer against the unsplit model.
+    The input is cut into strips with halo rows as the pipeline does, every
+    strip runs through the model on its own and the output rows it owns are
+    stitched back. The result has to match model.predict of the whole input.
+    It also shows the time of each strip, since strips run on different
+    devices at the same time, the slowest strip is the layer latency. Before
+    that, it checks that topology accepts a tiled layout the pipeline runs and
+    rejects the ones it can not run.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import model as ml
+import tiling
+import topology
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def timeit(model, X, runs):
+    model.predict(X)
+    start = time.time()
+    for _ in range(runs):
+        output = model.predict(X)
+    return output, (time.time() - start) / runs
+
+
+def check(stage, tiles, runs, tolerance):
+    """
+        Compare tiled and unsplit output of a stage.
+
+        Returns:
+            True if they match within tolerance.
+    """
+    model = stage.builder(ml)()
+    X = np.random.rand(1, *stage.shape) * (255 if stage.dtype == np.uint8 else 1)
+    X = X.astype(stage.dtype)
+    reference, total = timeit(model, X, runs)
+
+    layout = tiling.Tiling(tiling.rows(model), stage.shape[0], tiles)
+    flexible = tiling.flexible(model)
+    outputs, times = [], []
+    for (top, bottom), (first, last) in zip(layout.inputs, layout.outputs):
+        output, interval = timeit(flexible, X[:, top:bottom], runs)
+        outputs.append(output[:, first:last])
+        times.append(interval)
+    output = np.concatenate(outputs, axis=1)
+
+    error = np.abs(output - reference).max() if output.shape == reference.shape else float('inf')
+    print '{:s} in {:d} strips, max error: {:.2e}, {:s}'.format(
+        stage.name, tiles, error, 'ok' if error <= tolerance else 'MISMATCH')
+    for k, ((top, bottom), interval) in enumerate(zip(layout.inputs, times)):
+        print '    strip {:d}: input rows {:d}-{:d}, {:.3f} sec'.format(k, top, bottom, interval)
+    print '    whole input: {:.3f} sec, slowest strip: {:.3f} sec'.format(total, max(times))
+    return error <= tolerance
+
+
+def layouts():
+    """
+        Check tiled layouts against Topology.check.
+
+        Returns:
+            True if every layout is accepted or rejected as expected.
+    """
+    def stage(name, next, **kwargs):
+        return topology.Stage(name, name, 'float32', [8, 8, 1], next, **kwargs)
+
+    cases = [('tiled', [stage('a', 'b', tiles=2), stage('b', 'initial', merge=2)], None),
+             ('tiled after merge', [stage('a', 'b', fanout=2), stage('b', 'c', merge=2, tiles=2),
+                                    stage('c', 'initial', merge=2)], 'b merges and is tiled'),
+             ('strips not merged', [stage('a', 'b', tiles=2), stage('b', 'initial')],
+              'strips of previous stage are not merged by b')]
+    passed = True
+    for title, stages, expected in cases:
+        try:
+            topology.Topology(stages)
+            error = None
+        except ValueError, e:
+            error = str(e)
+        print 'layout {:s}: {:s}, {:s}'.format(title, error or 'accepted', 'ok' if error == expected else 'MISMATCH')
+        passed = passed and error == expected
+    return passed
+
+
+def main(cmd):
+    stages = topology.load(table=None).stages
+    name = cmd.stage or next((stage.name for stage in stages.values() if stage.tiles > 1), None)
+    if name is None:
+        raise ValueError('no tiled stage in topology, pick one with -s')
+    passed = layouts()
+    for tiles in cmd.tiles or [stages[name].tiles]:
+        passed = check(stages[name], tiles, cmd.runs, cmd.tolerance) and passed
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--stage',
+                        help='stage to check, first tiled stage in topology by default')
+    parser.add_argument('-n', '--tiles', type=int, nargs='+',
+                        help='numbers of strips to check, tiles of the stage by default')
+    parser.add_argument('-r', '--runs', type=int, default=3,
+                        help='number of runs to time')
+    parser.add_argument('--tolerance', type=float, default=1e-4,
+                        help='largest absolute difference allowed')
+    cmd = parser.parse_args()
+    main(cmd)
@@ -0,0 +1,234 @@
+"""
+    This module reads the pipeline topology, so a new partition of the model
+    is a change of config files instead of code. The topology file lists the
+    stages in pipeline order:
+
+        model: Function in model.py that builds the model of the stage.
+        args: Arguments of the model function, optional.
+        input: Data type and shape of one input of the model, without batch axis.
+        next: Stage the output is sent to, initial for the result.
+        fan-out: Number of devices of next stage each output is sent to, each
+                copy with its own partition index.
+        merge: Number of partitions joined by frame id, concatenated in
+                partition order along the last axis before model inference.
+        tiles: Number of horizontal strips the input is cut into by previous
+                stage, each runs on a different device of this stage, see tiling.py.
+        split: The model is split by output neurons over the devices of this
+                stage, each holds the weights of one slice. Every device gets
+                the whole input, and next stage merges a partition from each
+                of them, concatenated, or summed with split: sum when each
+                slice gives a partial sum of the output.
+        precision: Data type the model computes in, float32 by default or
+                float16, see model.precision. Input and output stay float32.
+        batch: Largest number of queued frames run as one batch by a node of
+                the stage, optional, node.py -b by default.
+        wait: Milliseconds to wait for a batch to fill, optional, node.py
+                --wait by default.
+
+    Stage names are at most 16 bytes, and ping and ready are reserved for
+    control frames of raw TCP transport.
+
+    A fan-out must be merged by a later stage with the same number of
+    partitions. Stages between them run on each partition on its own. Strips
+    of a tiled stage must be merged by next stage, along the row axis, and a
+    tiled stage can not merge partitions itself. The
+    slices of a split stage are as many as its devices in the IP table, so
+    fan-out and merge width follow the IP table and are not written.
+
+    Replica addresses and codecs of each stage stay in the IP table, since
+    they change with the device network and not with the partition.
+
+    An optional defaults section of the topology file sets command line
+    defaults of node.py and initial.py for the deployment, by option name,
+    such as rate: 1.0 for a slow pipeline. Flags given on the command line
+    still win.
+"""
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+import yaml
+
+import wire
+
+# bfloat16 has no convolution kernels on CPU in TensorFlow 1.x.
+PRECISIONS = ('float32', 'float16')
+
+
+class Stage(object):
+    """
+        Stage of the pipeline.
+
+        Attributes:
+            name: Stage name, requests for the stage carry it.
+            model: Name of model builder in model.py.
+            args: List of arguments of model builder.
+            dtype: Numpy data type of input.
+            shape: Tuple of input shape without batch axis.
+            next: Name of next stage, initial for the result.
+            fanout: Number of partitions each output is sent as.
+            merge: Number of partitions joined before model inference, 1 if the
+                    stage does not join.
+            axis: Axis partitions are concatenated along when joined, rows for
+                    strips of a tiled stage, last axis otherwise.
+            tiles: Number of strips the input is cut into, 1 if it is not tiled.
+            split: How partitions of a split stage are merged, concat or sum, None
+                    if the stage is not split.
+            parts: Number of slices of a split stage, one for each device.
+            reduce: How partitions are joined, concat along axis or sum.
+            precision: Data type the model computes in.
+            batch: Largest batch of the stage, None for the node default.
+            wait: Seconds to wait for a batch to fill, None for the node default.
+    """
+
+    def __init__(self, name, model, dtype, shape, next, fanout=1, merge=1, args=None, tiles=1, split=None,
+                 precision='float32', batch=None, wait=None):
+        self.name = name
+        self.model = model
+        self.args = args or []
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.next = next
+        self.fanout = fanout
+        self.merge = merge
+        self.axis = -1
+        self.tiles = tiles
+        self.split = split
+        self.parts = 1
+        self.reduce = 'concat'
+        self.precision = precision
+        self.batch = batch
+        self.wait = wait
+
+    def builder(self, module, part=0):
+        """
+            Function builds the model of the stage from model module, slice part
+            of a split stage, in the precision of the stage.
+        """
+        if self.split is not None:
+            builder = partial(getattr(module, self.model), *(self.args + [part, self.parts]))
+        else:
+            builder = partial(getattr(module, self.model), *self.args)
+        if self.precision != 'float32':
+            return partial(module.precision, builder, self.precision)
+        return builder
+
+
+class Topology(object):
+    """
+        Stages of the pipeline with their devices.
+
+        Attributes:
+            stages: An ordered dictionary maps stage name to stage, in pipeline order.
+            replicas: A dictionary maps stage name, or initial, to list of device
+                    addresses.
+            codec: A dictionary maps stage name, or initial, to codec of its input edge.
+    """
+
+    def __init__(self, stages, replicas=None, codec=None):
+        self.stages = OrderedDict((stage.name, stage) for stage in stages)
+        self.replicas = replicas or dict()
+        self.codec = codec or dict()
+        self.check()
+
+    @property
+    def first(self):
+        """ Stage the initializer sends frames to. """
+        return self.stages.values()[0]
+
+    def check(self):
+        """
+            Check that stages are chained up to initial and every fan-out is merged.
+
+            Raises:
+                ValueError: if the topology is not valid.
+        """
+        if len(self.stages) == 0:
+            raise ValueError('topology has no stage')
+        # kind of partitions not merged yet: copies of a fan-out, strips or slices.
+        parts, kind, reduce = 1, None, 'concat'
+        for name, stage in self.stages.items():
+            if stage.next != 'initial' and stage.next not in self.stages:
+                raise ValueError('next stage {} of {} is not in topology'.format(stage.next, name))
+            # requests carry the name in a fixed width field of raw TCP frame.
+            if len(name.encode('utf-8')) > wire.NAME_SIZE:
+                raise ValueError('stage name {} is longer than {:d} bytes'.format(name, wire.NAME_SIZE))
+            if name in wire.CONTROL:
+                raise ValueError('stage name {} is reserved for control frames'.format(name))
+            if stage.batch is not None and stage.batch < 1:
+                raise ValueError('{} has batch {}, expect at least 1'.format(name, stage.batch))
+            if stage.wait is not None and stage.wait < 0:
+                raise ValueError('{} waits {} sec for a batch'.format(name, stage.wait))
+            if stage.precision not in PRECISIONS:
+                raise ValueError('{} has precision {}, expect one of {}'.format(
+                    name, stage.precision, ', '.join(PRECISIONS)))
+            if kind == 'slices' and stage.merge == 1:
+                stage.merge = parts
+            if stage.merge > 1:
+                if parts != stage.merge:
+                    raise ValueError('{} merges {} partitions, but gets {}'.format(name, stage.merge, parts))
+                stage.axis = 0 if kind == 'strips' else -1
+                stage.reduce = reduce
+                parts, kind, reduce = 1, None, 'concat'
+            elif kind == 'strips':
+                raise ValueError('strips of previous stage are not merged by {}'.format(name))
+            if stage.split is not None:
+                if stage.split not in ('concat', 'sum'):
+                    raise ValueError('{} is split with unknown merge {}'.format(name, stage.split))
+                if name == self.first.name:
+                    raise ValueError('first stage {} can not be split'.format(name))
+                if parts > 1:
+                    raise ValueError('{} is split from partitions that are not merged'.format(name))
+                stage.parts = max(1, len(self.replicas.get(name, [])))
+                if stage.parts > 1:
+                    parts, kind, reduce = stage.parts, 'slices', stage.split
+            if stage.tiles > 1:
+                # strips are cut from the input of one device, not from a joined frame.
+                if stage.merge > 1:
+                    raise ValueError('{} merges and is tiled'.format(name))
+                if parts > 1:
+                    raise ValueError('{} is tiled from partitions that are not merged'.format(name))
+                parts, kind = stage.tiles, 'strips'
+            if stage.fanout > 1:
+                if parts > 1:
+                    raise ValueError('{} fans out partitions that are not merged'.format(name))
+                if stage.next in self.stages and self.stages[stage.next].split is not None:
+                    raise ValueError('{} fans out to split stage {}'.format(name, stage.next))
+                parts, kind = stage.fanout, 'copies'
+        if parts > 1:
+            raise ValueError('{} partitions are never merged'.format(parts))
+
+
+def defaults(path='resource/topology'):
+    """ Command line defaults of the deployment from topology file, by option name. """
+    with open(path) as file:
+        return yaml.safe_load(file).get('defaults') or dict()
+
+
+def load(path='resource/topology', table='resource/ip'):
+    """
+        Read topology file and IP table.
+
+        Args:
+            path: Topology file.
+            table: IP table with device addresses and codecs, None to skip it.
+
+        Returns:
+            Topology.
+    """
+    with open(path) as file:
+        config = yaml.safe_load(file)
+    stages = [Stage(spec['name'], spec['model'], spec['input']['dtype'], spec['input']['shape'], spec['next'],
+                    spec.get('fan-out', 1), spec.get('merge', 1), spec.get('args'),
+                    spec.get('tiles', 1), spec.get('split'), spec.get('precision', 'float32'),
+                    spec.get('batch'), spec['wait'] / 1000.0 if 'wait' in spec else None)
+              for spec in config['stages']]
+    replicas, codec = dict(), dict()
+    if table is not None:
+        with open(table) as file:
+            address = yaml.safe_load(file)
+        codec = address.get('codec') or dict()
+        for name, addresses in address['node'].items():
+            # addresses after # are left out.
+            replicas[name] = addresses[:addresses.index('#')] if '#' in addresses else list(addresses)
+    return Topology(stages, replicas, codec)
@@ -0,0 +1,206 @@
+"""
+    This module defines the trace record carried by every packet. Each layer
+    a frame goes through appends a hop with its own timestamps, so the
+    initializer gets the whole path of the frame with its result and splits it
+    into spans of each stage and each link between stages.
+
+    Trace layout (network byte order):
+        frame id (Q), number of hops (B), hops
+
+    Hop layout:
+        stage name (16s), partition index (H), offset (d), receive, decode,
+        start, predict, encode, send (6 x d)
+
+    The stage name field is as wide as the one of raw TCP frame, wire.NAME_SIZE,
+    and topology.py checks that every stage name fits in it.
+
+    offset: Clock of the device of next hop minus clock of this device, as
+            estimated by ping exchanges of this device.
+
+    receive: Request arrives.
+    decode: Input is decoded.
+    start: Worker starts model inference, after waiting in queue.
+    predict: Model inference is done.
+    encode: Output is encoded.
+    send: Output is being sent to next layer, after waiting for a free device.
+
+    Timestamps are wall clock of each device. The initializer adds up offsets
+    along the path to move every timestamp onto its own clock, so a span across
+    devices is as good as the offset estimates, within half a round trip time.
+"""
+import json
+import struct
+import time
+from collections import OrderedDict, deque
+from threading import Lock
+
+import numpy as np
+
+import wire
+
+HEAD = struct.Struct('!QB')
+HOP = struct.Struct('!%dsHd6d' % wire.NAME_SIZE)
+FIELDS = ('receive', 'decode', 'start', 'predict', 'encode', 'send')
+# span of a hop between two of its timestamps.
+PHASES = (('decode', 'receive', 'decode'), ('queue', 'decode', 'start'), ('predict', 'start', 'predict'),
+          ('encode', 'predict', 'encode'), ('wait', 'encode', 'send'))
+# where the latency of a frame goes, links between stages are network.
+CATEGORIES = {'decode': 'codec', 'encode': 'codec', 'queue': 'queue', 'wait': 'queue', 'predict': 'compute'}
+
+
+class Trace(object):
+    """
+        Trace record of a frame.
+
+        Attributes:
+            frame_id: Id of frame.
+            hops: List of hops, each is a dictionary with stage name, partition
+                    index and timestamps, 0 for timestamps not taken.
+    """
+
+    def __init__(self, frame_id=0, hops=None):
+        self.frame_id = frame_id
+        self.hops = hops if hops is not None else []
+
+    @classmethod
+    def loads(cls, buf):
+        """ Decode trace record, an empty record gives an empty trace. """
+        if len(buf) == 0:
+            return cls()
+        frame_id, count = HEAD.unpack_from(buf)
+        hops = []
+        for k in range(count):
+            values = HOP.unpack_from(buf, HEAD.size + k * HOP.size)
+            hop = dict(zip(FIELDS, values[3:]))
+            hop['stage'], hop['part'], hop['offset'] = values[0].rstrip(b'\0'), values[1], values[2]
+            hops.append(hop)
+        return cls(frame_id, hops)
+
+    def dumps(self):
+        return HEAD.pack(self.frame_id, len(self.hops)) + b''.join(
+            HOP.pack(hop['stage'], hop['part'], hop['offset'], *[hop[field] for field in FIELDS])
+            for hop in self.hops)
+
+    def begin(self, stage, part=0):
+        """ Start hop of this layer, stamped with receive time. """
+        hop = dict.fromkeys(FIELDS, 0.0)
+        hop['stage'], hop['part'], hop['offset'], hop['receive'] = str(stage), part, 0.0, time.time()
+        self.hops.append(hop)
+
+    def mark(self, *fields):
+        """ Stamp current time into hop of this layer. """
+        now = time.time()
+        for field in fields:
+            self.hops[-1][field] = now
+
+    def copy(self):
+        """ Copy for a branch of fan-out, hops are filled by each branch on its own. """
+        return Trace(self.frame_id, [dict(hop) for hop in self.hops])
+
+
+def mark(traces, field):
+    """ Stamp current time into each trace of a batch. """
+    now = time.time()
+    for trace in traces:
+        trace.hops[-1][field] = now
+
+
+def label(hop):
+    """ Name of hop, partition index tells apart devices of the same layer. """
+    return '{:s}/{:d}'.format(hop['stage'], hop['part']) if hop['part'] > 0 else hop['stage']
+
+
+def spans(trace, end):
+    """
+        Split trace into spans on the clock of the first hop, which is the
+        initializer that gets the result.
+
+        Args:
+            trace: Trace record of a frame.
+            end: Time the result arrives.
+
+        Returns:
+            List of tuples of stage or link name, phase, start and end time. The
+            phase is total for the whole stage and network for a link.
+    """
+    result = []
+    # clock of current hop minus clock of first hop.
+    shift = 0.0
+    for k, hop in enumerate(trace.hops):
+        times = dict((field, hop[field] - shift) for field in FIELDS if hop[field] > 0)
+        if 'receive' in times and 'send' in times:
+            result.append((label(hop), 'total', times['receive'], times['send']))
+        for phase, first, last in PHASES:
+            if first in times and last in times:
+                result.append((label(hop), phase, times[first], times[last]))
+        shift += hop['offset']
+        if k + 1 < len(trace.hops):
+            target, arrival = label(trace.hops[k + 1]), trace.hops[k + 1]['receive'] - shift
+        else:
+            target, arrival = 'result', end
+        if 'send' in times:
+            result.append(('{:s}->{:s}'.format(label(hop), target), 'network', times['send'], arrival))
+    if trace.hops:
+        result.append(('frame', 'total', trace.hops[0]['receive'], end))
+    return result
+
+
+class TraceStat(object):
+    """
+        Latency percentiles of stages and links from traces of completed frames,
+        optionally written to a Chrome trace file (chrome://tracing).
+
+        Attributes:
+            samples: An ordered dictionary maps (name, phase) to recent durations.
+            size: Number of recent durations kept for each span.
+            rows: A dictionary maps stage or link name to row in Chrome trace.
+            file: Chrome trace file, None if not exported.
+            lock: Threading lock for samples and file.
+    """
+
+    def __init__(self, path=None, size=10000):
+        self.samples = OrderedDict()
+        self.size = size
+        self.rows = dict()
+        self.file = None
+        self.lock = Lock()
+        if path is not None:
+            # the closing bracket of JSON array is optional for Chrome trace, so
+            # events are appended as frames complete.
+            self.file = open(path, 'w')
+            self.file.write('[\n')
+
+    def add(self, trace, end=None):
+        """ Record spans of a completed frame. """
+        end = time.time() if end is None else end
+        with self.lock:
+            breakdown = OrderedDict((category, 0.0) for category in ('network', 'queue', 'compute', 'codec'))
+            for name, phase, first, last in spans(trace, end):
+                self.samples.setdefault((name, phase), deque(maxlen=self.size)).append(last - first)
+                category = 'network' if phase == 'network' else CATEGORIES.get(phase)
+                if category is not None:
+                    breakdown[category] += last - first
+                if self.file is not None:
+                    self.write(name, phase, first, last, trace.frame_id)
+            for category, interval in breakdown.items():
+                self.samples.setdefault(('frame', category), deque(maxlen=self.size)).append(interval)
+            if self.file is not None:
+                self.file.flush()
+
+    def write(self, name, phase, first, last, frame_id):
+        if name not in self.rows:
+            self.rows[name] = len(self.rows)
+            self.file.write(json.dumps({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': self.rows[name],
+                                        'args': {'name': name}}) + ',\n')
+        self.file.write(json.dumps({'name': name if phase in ('total', 'network') else phase, 'cat': phase,
+                                    'ph': 'X', 'ts': first * 1e6, 'dur': (last - first) * 1e6, 'pid': 0,
+                                    'tid': self.rows[name], 'args': {'frame': frame_id}}) + ',\n')
+
+    def report(self):
+        with self.lock:
+            lines = []
+            for (name, phase), values in self.samples.items():
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                lines.append('{:>32s} {:8s} p50: {:.3f}, p95: {:.3f}, p99: {:.3f} sec'.format(
+                    name, phase, p50, p95, p99))
+            return '\n'.join(lines)
@@ -0,0 +1,137 @@
+"""
+    This module keeps the weights of each stage in a weight store, so a node
+    reads only the weights of the layers it serves instead of the weights of
+    the whole model.
+
+    The store is written once from the weights of the whole model (model.layers),
+    such as pretrained Keras weights in HDF5. Layers with weights are handed
+    to the stages in pipeline order. A split stage gets a directory for each
+    slice with only the weights of that slice, see model.slices, as many as
+    its devices in the IP table.
+
+    Store layout:
+        <stage>/<k>.npy for the k-th weight array of a stage,
+        <stage>/<part>-of-<parts>/<k>.npy for a slice of a split stage,
+        model.json next to the arrays for the Keras architecture of the stage
+        or slice, so the numpy engine runs it without Keras.
+
+    A node maps the arrays with numpy mmap mode. Only the numpy engine
+    (dense.py) runs from the mapped float32 kernels, so its pages are read from
+    disk as they are used, and processes of several stages on one host share
+    the page cache of the files. A Keras model copies the arrays into its
+    variables by set_weights, and int8 kernels are quantized into memory, so
+    for those the store only saves reading the weights of other stages.
+
+    Only writing the store needs TensorFlow and Keras, reading it does not.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+# model.py and resource/ of the deployment are in the working directory.
+sys.path.insert(1, os.getcwd())
+
+import topology
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def path(root, stage, part=0):
+    """ Directory of the weights of a stage, or of its slice part if it is split. """
+    if stage.split is not None:
+        return os.path.join(root, stage.name, '{:d}-of-{:d}'.format(part, stage.parts))
+    return os.path.join(root, stage.name)
+
+
+def read(root, stage, part=0):
+    """
+        Weight arrays of a stage in the order of model.get_weights, mapped from
+        weight store.
+
+        Raises:
+            IOError: if the store has no weights of the stage.
+    """
+    directory = path(root, stage, part)
+    if not os.path.isdir(directory):
+        raise IOError('no weights of {} in {}'.format(stage.name, directory))
+    names = sorted((name for name in os.listdir(directory) if name.endswith('.npy')),
+                   key=lambda name: int(name[:-len('.npy')]))
+    return [np.load(os.path.join(directory, name), mmap_mode='r') for name in names]
+
+
+def builder(root, stage, module, part=0):
+    """ Function builds the model of a stage like Stage.builder, with weights from weight store. """
+    def build():
+        model = stage.builder(module, part)()
+        model.set_weights(read(root, stage, part))
+        return model
+    return build
+
+
+def export(whole, stages, root):
+    """
+        Write weight store.
+
+        Args:
+            whole: List of weight arrays of each layer with weights in the whole
+                    model, in order.
+            stages: Stages in pipeline order.
+            root: Directory of weight store.
+
+        Raises:
+            ValueError: if the layers of the stages do not match the whole model.
+    """
+    import tensorflow as tf
+    from keras import backend as K
+    import model as ml
+
+    layers = list(whole)
+    for stage in stages:
+        # models are only built to read weight shapes, their own graph is never run.
+        with tf.Graph().as_default():
+            count = len([layer for layer in stage.builder(ml)().layers if layer.weights])
+            arrays = [array for weights in layers[:count] for array in weights]
+            layers = layers[count:]
+            for part in range(stage.parts if stage.split is not None else 1):
+                model = stage.builder(ml, part)()
+                shapes = [K.int_shape(weight) for weight in model.weights]
+                sliced = ml.slices(arrays, part, stage.parts) if stage.split is not None else arrays
+                if [array.shape for array in sliced] != shapes:
+                    raise ValueError('weights of {} have shapes {}, expect {}'.format(
+                        stage.name, [array.shape for array in sliced], shapes))
+                directory = path(root, stage, part)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                for k, array in enumerate(sliced):
+                    np.save(os.path.join(directory, '{:d}.npy'.format(k)), np.ascontiguousarray(array))
+                with open(os.path.join(directory, 'model.json'), 'w') as file:
+                    file.write(model.to_json(indent=4))
+                print '{:s}: {:d} arrays, {:.1f} MB'.format(
+                    directory, len(sliced), sum(array.nbytes for array in sliced) / 2.0 ** 20)
+    if len(layers) > 0:
+        raise ValueError('{} layers of the whole model are in no stage'.format(len(layers)))
+
+
+def main(cmd):
+    from keras import backend as K
+    import model as ml
+
+    model = ml.part(0, len(ml.layers()))
+    if cmd.input is not None:
+        # Keras matches layers with weights of the file in order.
+        model.load_weights(cmd.input)
+    whole = [layer.get_weights() for layer in model.layers if layer.weights]
+    K.clear_session()
+    export(whole, topology.load().stages.values(), cmd.output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', metavar='FILE',
+                        help='Keras HDF5 weights of the whole model, random weights if not set')
+    parser.add_argument('-o', '--output', metavar='DIR', default='resource/weights',
+                        help='directory of weight store')
+    cmd = parser.parse_args()
+    main(cmd)
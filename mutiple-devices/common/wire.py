@@ -0,0 +1,273 @@
+"""
+    This module defines the self-describing tensor format and the raw TCP
+    transport. A tensor is sent as a small header with dtype and shape followed
+    by the array buffer, so the receiver gets the shape from the packet instead
+    of hard-coded literals.
+
+    Tensor layout (network byte order):
+        dtype (8s), ndim (B), shape (ndim x I), array buffer
+
+    Raw TCP frame layout:
+        size (I), trace size (H), frame id (Q), partition index (H),
+        stage name (16s), trace, payload
+
+    The trace is a trace record of timestamps of each layer. The payload is a
+    codec packet, which wraps a tensor.
+
+    Each raw TCP frame is acknowledged with a single byte after it has been
+    handled, which keeps the same blocking semantic as Avro forward request.
+    A frame the server fails to handle is answered with a zero byte, and the
+    connection stays open for next frames. A frame for ping stage is answered with the clock of the server instead,
+    and a frame for ready stage with ack once the server is ready to run
+    frames, or a zero byte before. Stage names are at most NAME_SIZE bytes and
+    the names of control frames are reserved, topology.py checks both.
+"""
+import socket
+import struct
+import time
+import traceback
+from SocketServer import ThreadingMixIn, TCPServer, BaseRequestHandler
+
+import numpy as np
+
+import shm
+
+# stage name is a fixed width field, shorter names are padded with zeros.
+NAME_SIZE = 16
+TENSOR = struct.Struct('!8sB')
+FRAME = struct.Struct('!IHQH%ds' % NAME_SIZE)
+ACK = b'\x01'
+NACK = b'\x00'
+CLOCK = struct.Struct('!d')
+PING = b'ping'
+READY = b'ready'
+CONTROL = (PING, READY)
+
+
+class FrameError(IOError):
+    """ Raised when connection is closed in the middle of a frame. """
+
+
+class FrameRejected(Exception):
+    """ Raised when the other side failed to handle a frame, the connection is still good. """
+
+
+def header(X):
+    """
+        Tensor header for a numpy array.
+
+        Args:
+            X: numpy array.
+
+        Returns:
+            Byte string of dtype and shape.
+    """
+    return TENSOR.pack(X.dtype.str, X.ndim) + struct.pack('!%dI' % X.ndim, *X.shape)
+
+
+def dumps(X):
+    """ Encode array into tensor byte string, used by Avro bytes field. """
+    X = np.ascontiguousarray(X)
+    return header(X) + X.tobytes()
+
+
+def unpack_header(buf, offset=0):
+    """
+        Parse tensor header.
+
+        Args:
+            buf: Byte string or bytearray holding tensor.
+            offset: Start of tensor in buf.
+
+        Returns:
+            Tuple of dtype, shape and offset of array buffer.
+    """
+    dtype, ndim = TENSOR.unpack_from(buf, offset)
+    offset += TENSOR.size
+    shape = struct.unpack_from('!%dI' % ndim, buf, offset)
+    return np.dtype(dtype.rstrip(b'\0')), shape, offset + 4 * ndim
+
+
+def loads(buf, offset=0, size=None):
+    """
+        Decode tensor without copying the array buffer. The returned array is a
+        view of buf, it is read only if buf is a byte string.
+
+        Args:
+            buf: Byte string or bytearray holding tensor.
+            offset: Start of tensor in buf.
+            size: Size of tensor in buf, default to the rest of buf.
+
+        Returns:
+            numpy array.
+
+        Raises:
+            ValueError: if the buffer size does not match header.
+    """
+    end = len(buf) if size is None else offset + size
+    dtype, shape, offset = unpack_header(buf, offset)
+    count = int(np.prod(shape))
+    if offset + count * dtype.itemsize != end:
+        raise ValueError('tensor size does not match header {}'.format(shape))
+    return np.frombuffer(buf, dtype, count, offset).reshape(shape)
+
+
+def send_frame(sock, frame_id, part, stage, trace, head, body):
+    """
+        Send a frame. An array body is sent straight from its buffer, only the
+        header is copied.
+
+        Args:
+            sock: Connected socket.
+            frame_id: Integer id of frame.
+            part: Partition index of a layer output split over several devices.
+            stage: Name of next stage.
+            trace: Trace record byte string.
+            head: Payload header byte string.
+            body: Payload body, numpy array or byte string.
+    """
+    if isinstance(body, np.ndarray):
+        size = body.nbytes
+        body = memoryview(np.ascontiguousarray(body).reshape(-1))
+    else:
+        size = len(body)
+    sock.sendall(FRAME.pack(len(head) + size, len(trace), frame_id, part, stage) + trace + head)
+    sock.sendall(body)
+
+
+def fill(sock, view):
+    """ recv_into view until it is full. """
+    got = 0
+    while got < len(view):
+        n = sock.recv_into(view[got:])
+        if n == 0:
+            raise FrameError('connection closed in the middle of frame')
+        got += n
+
+
+class FrameReader(object):
+    """
+        Read frames from a socket into a preallocated buffer. The buffer only
+        grows, so after the first frame no allocation is done. A raw payload
+        decoded from the buffer is a view of it and only valid until next read,
+        copy it if it has to be kept.
+
+        Attributes:
+            sock: Connected socket.
+            head: Buffer for frame header.
+            buffer: Buffer for payload.
+    """
+
+    def __init__(self, sock, size=0):
+        self.sock = sock
+        self.head = bytearray(FRAME.size)
+        self.buffer = bytearray(size)
+
+    def fill(self, view):
+        """ recv_into view until it is full. """
+        fill(self.sock, view)
+
+    def read(self):
+        """
+            Read next frame.
+
+            Returns:
+                Tuple of frame id, partition index, stage name, trace record, buffer
+                and payload size, or None if connection is closed between frames.
+        """
+        view = memoryview(self.head)
+        n = self.sock.recv_into(view)
+        if n == 0:
+            return None
+        self.fill(view[n:])
+        size, length, frame_id, part, stage = FRAME.unpack_from(self.head)
+        trace = bytearray(length)
+        self.fill(memoryview(trace))
+        if len(self.buffer) < size:
+            self.buffer = bytearray(size)
+        self.fill(memoryview(self.buffer)[:size])
+        return frame_id, part, stage.rstrip(b'\0'), bytes(trace), self.buffer, size
+
+
+class TensorConnection(object):
+    """ Persistent raw TCP connection to a device, used by ConnectionPool. """
+
+    def __init__(self, address, port):
+        self.sock = socket.create_connection((address, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def request(self, frame_id, part, stage, trace, head, body):
+        """ Send frame and wait until the other side has handled it. """
+        send_frame(self.sock, frame_id, part, stage, trace, head, body)
+        answer = self.sock.recv(1)
+        if answer == NACK:
+            raise FrameRejected('frame {:d} for {:s} failed on the other side'.format(frame_id, stage))
+        if answer != ACK:
+            raise FrameError('connection closed before ack')
+
+    def ping(self):
+        """ Clock of the other side. """
+        send_frame(self.sock, 0, 0, PING, b'', b'', b'')
+        answer = bytearray(CLOCK.size)
+        fill(self.sock, memoryview(answer))
+        return CLOCK.unpack_from(answer)[0]
+
+    def ready(self):
+        """ If the other side is ready to run frames. """
+        send_frame(self.sock, 0, 0, READY, b'', b'', b'')
+        answer = self.sock.recv(1)
+        if answer not in (ACK, NACK):
+            raise FrameError('connection closed before ready answer')
+        return answer == ACK
+
+    def close(self):
+        self.sock.close()
+
+
+class TensorHandler(BaseRequestHandler):
+    """ Read frames from one connection and pass them to server callback. """
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def finish(self):
+        shm.release()
+
+    def handle(self):
+        reader = FrameReader(self.request)
+        while True:
+            frame = reader.read()
+            if frame is None:
+                return
+            if frame[2] == PING:
+                self.request.sendall(CLOCK.pack(time.time()))
+                continue
+            if frame[2] == READY:
+                self.request.sendall(ACK if self.server.ready() else NACK)
+                continue
+            try:
+                self.server.callback(*frame)
+            except Exception:
+                # one bad frame should not close the stream of the frames behind it.
+                traceback.print_exc()
+                self.request.sendall(NACK)
+                continue
+            self.request.sendall(ACK)
+
+
+class TensorServer(ThreadingMixIn, TCPServer):
+    """
+        Raw TCP server handles each connection in separate thread.
+
+        Attributes:
+            callback: Function called with frame id, partition index, stage name,
+                    trace record, buffer and payload size of each frame.
+            ready: Function tells if the server is ready to run frames.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, callback, ready=lambda: True):
+        TCPServer.__init__(self, address, TensorHandler)
+        self.callback = callback
+        self.ready = ready
@@ -1,7 +1,8 @@
 """
     This module defines different blocks in the VGG16 neural network.
 """
-from keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
+from keras import backend as K
+from keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Activation, Lambda
 from keras.models import Model, Input
 
 
@@ -51,18 +52,115 @@ def block5():
     return model
 
 
-def fc1():
-    """ First fully connected layer in VGG16. """
+def neurons(units, part, parts):
+    """ First and last (exclusive) output neuron of slice part of a layer split into parts. """
+    return units * part // parts, units * (part + 1) // parts
+
+
+def fc1(part=0, parts=2):
+    """
+        First fully connected layer in VGG16. It is split by output
+        neurons, this is slice part of parts, half of the layer by default.
+    """
     image = Input(shape=(25088,))
-    layer = Dense(2048, activation='relu')(image)
+    first, last = neurons(4096, part, parts)
+    layer = Dense(last - first, activation='relu')(image)
     model = Model(image, layer)
     return model
 
 
-def fc2():
-    """ Last two fully connected layer. """
+def fc2(part=None, parts=1):
+    """
+        Last two fully connected layer. Without part it is the
+        whole block. Slice part of parts has output neurons of its slice of
+        the first layer and rows of the same slice of the second, so its
+        output is a partial sum of the logits, with the bias on slice 0. The
+        sum of all slices goes through softmax.
+    """
     image = Input(shape=(4096,))
-    layer = Dense(4096, activation='relu')(image)
-    layer = Dense(1000, activation='softmax')(layer)
+    if part is None:
+        layer = Dense(4096, activation='relu')(image)
+        layer = Dense(1000, activation='softmax')(layer)
+    else:
+        first, last = neurons(4096, part, parts)
+        layer = Dense(last - first, activation='relu')(image)
+        layer = Dense(1000, use_bias=part == 0)(layer)
+    model = Model(image, layer)
+    return model
+
+
+def softmax():
+    """ Softmax of the logits summed from slices of fc2. """
+    image = Input(shape=(1000,))
+    layer = Activation('softmax')(image)
+    model = Model(image, layer)
+    return model
+
+
+def slices(weights, part, parts):
+    """
+        Weights of slice part of a split fully connected block, from weights of
+        the whole block as get_weights returns them. The first layer keeps the
+        columns of its output neurons, a second layer the same rows of its
+        kernel, and its bias on slice 0 only.
+    """
+    kernel, bias = weights[:2]
+    first, last = neurons(len(bias), part, parts)
+    result = [kernel[:, first:last], bias[first:last]]
+    if len(weights) > 2:
+        result.append(weights[2][first:last])
+        if part == 0:
+            result.append(weights[3])
+    return result
+
+
+def layers():
+    """
+        Layers of the whole VGG16 in order, both halves of fc1 are one layer.
+        A partition planned by planner.py runs a slice of them.
+    """
+    result = []
+    for filters, convs in ((64, 2), (128, 2), (256, 3), (512, 3), (512, 3)):
+        result.extend(Conv2D(filters, (3, 3), activation='relu', padding='same') for _ in range(convs))
+        result.append(MaxPooling2D((2, 2), strides=(2, 2)))
+    return result + [Flatten(), Dense(4096, activation='relu'), Dense(4096, activation='relu'),
+                     Dense(1000, activation='softmax')]
+
+
+def shapes():
+    """ Input shape of each layer in layers, followed by output shape of the last one. """
+    result = [(None, 224, 224, 3)]
+    for layer in layers():
+        result.append(layer.compute_output_shape(result[-1]))
+    return [shape[1:] for shape in result]
+
+
+def part(first, last):
+    """ Layers first to last (exclusive) of the whole VGG16. """
+    image = Input(shape=shapes()[first])
+    layer = image
+    for block in layers()[first:last]:
+        layer = block(layer)
     model = Model(image, layer)
     return model
+
+
+def precision(builder, dtype):
+    """
+        Model of builder computed in a reduced precision dtype, such as float16.
+        Its layers are built with dtype as Keras float type, so weights and
+        activations are dtype. Input and output stay float32 and are cast at
+        the edges of the block, so previous and next stage do not change.
+    """
+    floatx = K.floatx()
+    K.set_floatx(dtype)
+    try:
+        model = builder()
+    finally:
+        K.set_floatx(floatx)
+    block_input = Input(shape=model.input_shape[1:])
+    layer = Lambda(K.cast, arguments={'dtype': dtype})(block_input)
+    for block in model.layers[1:]:
+        layer = block(layer)
+    layer = Lambda(K.cast, arguments={'dtype': floatx})(layer)
+    return Model(block_input, layer)
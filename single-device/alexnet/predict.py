@@ -1,14 +1,20 @@
 """ Run model prediction. """
 from model import alexnet
+from runner import Runner
 import numpy as np
 
 
 def main():
-    """ Call model construction function and run model multiple times. """
-    model = alexnet()
-    test_x = np.random.rand(224, 224, 3)
+    """
+        Call model construction function and run model multiple times. The model
+        runs through a session callable instead of Keras predict, with the input
+        array kept across frames.
+    """
+    model = Runner(alexnet())
+    test_x = model.inputs(1)
+    test_x[0] = np.random.rand(224, 224, 3)
     for _ in range(50):
-        model.predict(np.array([test_x]))
+        model.predict(test_x)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+"""
+    This module runs a model through a session callable instead of Keras
+    predict. On every call Keras predict checks and converts the input, cuts
+    it into batches and concatenates the outputs again, which is a large part
+    of the time of a small dense layer. A callable made once for the input and
+    output tensors of the model only feeds the array and fetches the output.
+
+    Input arrays can be kept and reused, one for each thread and batch size,
+    so a worker does not allocate its batch for every frame. A session
+    callable can not fetch into a given array, so every call returns a new
+    output array.
+"""
+import threading
+
+import numpy as np
+from keras import backend as K
+
+
+class Runner(object):
+    """
+        Model run by a session callable.
+
+        Attributes:
+            model: Keras model, or a frozen model with its own session.
+            call: Session callable from input array to output array.
+            feeds: Values of other placeholders of the model, learning phase.
+            dtype: Numpy data type of model input.
+            shape: Input shape without batch axis, None for an axis of any size.
+            output_shape: Output shape without batch axis.
+            local: Thread local input arrays of each shape.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # a frozen model brings its own session, a Keras model runs in the Keras one.
+        session = getattr(model, 'session', None) or K.get_session()
+        placeholders = [model.input]
+        self.feeds = []
+        if getattr(model, 'uses_learning_phase', False):
+            placeholders.append(K.learning_phase())
+            self.feeds.append(0)
+        self.call = session.make_callable(model.output, placeholders)
+        self.dtype = model.input.dtype.as_numpy_dtype
+        self.shape = tuple(model.input_shape[1:])
+        self.output_shape = tuple(model.output_shape[1:])
+        self.local = threading.local()
+
+    def predict(self, X):
+        """
+            Output of a batch.
+
+            Args:
+                X: Input array with batch axis.
+
+            Returns:
+                New output array.
+        """
+        return self.call(X, *self.feeds)
+
+    def inputs(self, size, shape=None):
+        """ Input array of this thread for a batch size, in input shape unless shape is given. """
+        shape = (size,) + tuple(shape or self.shape)
+        arrays = self.local.__dict__.setdefault('arrays', dict())
+        if shape not in arrays:
+            arrays[shape] = np.empty(shape, dtype=self.dtype)
+        return arrays[shape]
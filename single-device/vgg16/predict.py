@@ -1,13 +1,19 @@
 from model import vgg16
+from runner import Runner
 import numpy as np
 
 
 def main():
-    """ Call model construction function and run model multiple times. """
-    model = vgg16()
-    test_x = np.random.rand(224, 224, 3)
+    """
+        Call model construction function and run model multiple times. The model
+        runs through a session callable instead of Keras predict, with the input
+        array kept across frames.
+    """
+    model = Runner(vgg16())
+    test_x = model.inputs(1)
+    test_x[0] = np.random.rand(224, 224, 3)
     for _ in range(50):
-        model.predict(np.array([test_x]))
+        model.predict(test_x)
 
 
 if __name__ == '__main__':